@@ -0,0 +1,84 @@
+"""
+alpha2white 基准测试
+对比逐像素实现与整图蒙版实现在不同尺寸图片上的耗时，并检查结果逐像素一致
+同时给出 JPEG 编码前 flatten_alpha 的耗时
+
+用法: python benchmark/bench_alpha.py [最大逐像素测试像素数]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+import nonebot  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+nonebot.init(driver='~none')  # 导入插件包前需初始化 nonebot
+with tempfile.TemporaryDirectory() as workdir:  # 导入插件包时会在工作目录下创建 menu_config
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from nonebot_plugin_PicMenu.img_tool import alpha2white, flatten_alpha  # noqa: E402
+    finally:
+        os.chdir(cwd)
+
+SIZES = ((100, 100), (600, 800), (1200, 1500), (1200, 3000))
+
+
+def legacy_alpha2white(img):  # 原实现：逐像素 getpixel/putpixel
+    img = img.convert("RGBA")
+    width, height = img.size
+    for yh in range(height):
+        for xw in range(width):
+            dot = (xw, yh)
+            color_d = img.getpixel(dot)
+            if color_d[3] == 0:
+                color_d = (255, 255, 255, 255)
+                img.putpixel(dot, color_d)
+    return img
+
+
+def make_image(size, seed=0):
+    # 透明底版上随机绘制不透明、半透明色块，并混入透明但颜色不为0的像素
+    rand = random.Random(seed)
+    img = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for _ in range(200):
+        x, y = rand.randrange(size[0]), rand.randrange(size[1])
+        w, h = rand.randint(1, size[0] // 4 + 1), rand.randint(1, size[1] // 4 + 1)
+        color = (rand.randrange(256), rand.randrange(256), rand.randrange(256), rand.choice((0, 0, 128, 255)))
+        draw.rectangle((x, y, x + w, y + h), fill=color)
+    return img
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    max_legacy_pixels = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    for size in SIZES:
+        img = make_image(size)
+        new_result, new_time = timeit(alpha2white, img)
+        _, flatten_time = timeit(flatten_alpha, img)
+        line = f'{size[0]}x{size[1]}: 蒙版 {new_time * 1000:.1f}ms, flatten_alpha {flatten_time * 1000:.1f}ms'
+        if size[0] * size[1] <= max_legacy_pixels:
+            legacy_result, legacy_time = timeit(legacy_alpha2white, img)
+            same = legacy_result.tobytes() == new_result.tobytes()
+            line += f', 逐像素 {legacy_time * 1000:.1f}ms, 加速 {legacy_time / new_time:.0f}x, 结果一致: {same}'
+            print(line)
+            if not same:
+                sys.exit(1)
+        else:
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+模糊匹配基准测试
+对比对全部名称进行三轮 fuzzywuzzy 评分的原实现与 FuzzyIndex 候选筛选后评分的耗时，
+并检查两者在固定语料上的匹配结果一致
+原实现只对 partial_ratio 前10名计算最终 ratio，前10名同分时按原顺序截断，可能漏掉 ratio 更高的名称，
+此时两者结果不同，要求索引结果的 ratio 不低于原实现
+
+用法: python benchmark/bench_fuzzy.py [查询数量]
+"""
+import random
+import sys
+import time
+import warnings
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'nonebot_plugin_PicMenu'))
+warnings.filterwarnings('ignore')  # 未安装 python-Levenshtein 的提示
+from fuzzywuzzy import process, fuzz  # noqa: E402
+from search import FuzzyIndex, normalize_name  # noqa: E402
+
+COUNTS = (50, 200, 1000)
+WORDS = ['menu', 'sign', 'daily', 'music', 'search', 'image', 'weather', 'github', 'bilibili', 'translate',
+         'roll', 'poke', 'help', 'status', 'admin', 'group', 'word', 'cloud', 'setu', 'answer', 'repeat', 'wiki']
+CJK_WORDS = ['签到', '点歌', '天气', '翻译', '帮助', '状态', '词云', '复读', '抽卡', '今日', '运势', '搜图', '百科']
+
+
+def legacy_match(item, match_list):  # 原实现：对全部名称依次进行三轮评分
+    if item in match_list:
+        return item
+    vague_result = [x[0] for x in process.extract(item, match_list, scorer=fuzz.partial_ratio, limit=10)]
+    vague_result = [x[0] for x in process.extract(item, vague_result, scorer=fuzz.WRatio, limit=10)]
+    result = list(process.extract(item, vague_result, scorer=fuzz.ratio, limit=1))[0]
+    return None if result[1] < 45 else result[0]
+
+
+def final_score(query, name):  # 最终评分，无法匹配记为0
+    return 0 if name is None else fuzz.ratio(normalize_name(query), normalize_name(name))
+
+
+def make_names(count, seed=0):
+    rand = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        if rand.random() < 0.3:
+            names.add(''.join(rand.sample(CJK_WORDS, rand.randint(1, 2))))
+        else:
+            name = rand.choice(('', 'nonebot_plugin_', 'Pic')) + rand.choice(('_', '-', '')).join(
+                rand.sample(WORDS, rand.randint(1, 3)))
+            names.add(name + (str(rand.randint(0, 99)) if rand.random() < 0.3 else ''))
+    return sorted(names)
+
+
+def make_queries(names, count, seed=1):
+    rand = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        name = rand.choice(names)
+        kind = rand.randrange(5)
+        if kind == 0:  # 子串
+            begin = rand.randrange(len(name))
+            query = name[begin:begin + rand.randint(2, 8)]
+        elif kind == 1:  # 删除一个字符
+            i = rand.randrange(len(name))
+            query = name[:i] + name[i + 1:]
+        elif kind == 2:  # 交换相邻字符
+            i = rand.randrange(max(1, len(name) - 1))
+            query = name[:i] + name[i + 1:i + 2] + name[i:i + 1] + name[i + 2:]
+        elif kind == 3:  # 其他单词
+            query = rand.choice(WORDS + CJK_WORDS)
+        else:  # 大小写
+            query = name.swapcase()
+        queries.append(query or name)
+    return queries
+
+
+def main():
+    query_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for count in COUNTS:
+        names = make_names(count)
+        queries = make_queries(names, query_count)
+        start = time.perf_counter()
+        index = FuzzyIndex(names)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new_results = [index.match(x) for x in queries]
+        new_time = (time.perf_counter() - start) / len(queries)
+        start = time.perf_counter()
+        legacy_results = [legacy_match(x, names) for x in queries]
+        legacy_time = (time.perf_counter() - start) / len(queries)
+        diff = [(q, a, b) for q, a, b in zip(queries, legacy_results, new_results) if a != b]
+        worse = [x for x in diff if final_score(x[0], x[2]) < final_score(x[0], x[1])]
+        print(f'{count:>5} 个名称: 建立索引 {build_time * 1000:.1f}ms, 原实现 {legacy_time * 1000:.2f}ms/次, '
+              f'索引 {new_time * 1000:.2f}ms/次, 加速 {legacy_time / new_time:.1f}x, '
+              f'结果不一致 {len(diff)}/{len(queries)}, 其中评分更低 {len(worse)}')
+        for query, legacy, new in diff[:5]:
+            print(f'    {query!r}: 原实现 {legacy!r} ({final_score(query, legacy)}), '
+                  f'索引 {new!r} ({final_score(query, new)})')
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+插件导入耗时基准测试
+在子进程中使用 python -X importtime 加载插件，统计 nonebot.load_plugin 期间新导入模块的耗时（按顶层包汇总）、
+加载插件的总耗时，以及加载插件时是否导入了 Pillow、fuzzywuzzy 等重量级依赖
+nonebot 与 OneBot 适配器在加载插件前导入，不计入插件耗时；传入其他仓库路径可对比不同版本
+
+用法: python benchmark/bench_import.py [仓库路径] [重复次数]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ('PIL.Image', 'PIL.ImageDraw', 'PIL.ImageFont', 'fuzzywuzzy', 'multiprocessing',
+                 'nonebot_plugin_PicMenu.img_tool', 'nonebot_plugin_PicMenu.template')
+START_MARK = '--- PicMenu load start'
+END_MARK = '--- PicMenu load end'
+CHILD = '''
+import json, sys, time, warnings
+warnings.filterwarnings('ignore')
+import nonebot
+nonebot.init(driver='~none')
+import nonebot.adapters.onebot.v11
+sys.path.insert(0, {root!r})
+print({start!r}, file=sys.stderr, flush=True)
+before = set(sys.modules)
+start = time.perf_counter()
+nonebot.load_plugin('nonebot_plugin_PicMenu')
+elapsed = time.perf_counter() - start
+print({end!r}, file=sys.stderr, flush=True)
+print(json.dumps({{'elapsed': elapsed, 'loaded': [x for x in {heavy!r} if x in sys.modules and x not in before]}}))
+'''
+
+
+def run(root, workdir):
+    code = CHILD.format(root=str(root), start=START_MARK, end=END_MARK, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir,
+                            capture_output=True, text=True, check=True, env={**os.environ, 'LOG_LEVEL': 'WARNING'})
+    packages = defaultdict(int)  # 顶层包 -> 导入耗时（微秒，模块自身耗时之和）
+    recording = False
+    for line in result.stderr.splitlines():
+        if line == START_MARK:
+            recording = True
+        elif line == END_MARK:
+            recording = False
+        elif recording and line.startswith('import time:') and 'self [us]' not in line:
+            self_time, _, name = line[len('import time:'):].split('|')
+            packages[name.strip().split('.')[0]] += int(self_time)
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    summary['packages'] = packages
+    return summary
+
+
+def main():
+    root = Path(sys.argv[1]).resolve() if len(sys.argv) > 1 else ROOT
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as workdir:
+        (Path(workdir) / 'menu_config').mkdir()
+        with (Path(workdir) / 'menu_config' / 'config.json').open('w', encoding='utf-8') as fp:
+            json.dump({}, fp)
+        run(root, workdir)  # 生成字节码缓存，不计入结果
+        results = [run(root, workdir) for _ in range(repeat)]
+    elapsed = statistics.median(x['elapsed'] for x in results)
+    packages = {name: statistics.median(x['packages'].get(name, 0) for x in results)
+                for name in set().union(*(x['packages'] for x in results))}
+    print(f'{root}: 加载插件 {elapsed * 1000:.1f}ms (中位数，共 {repeat} 次), '
+          f'新导入模块 {sum(packages.values()) / 1000:.1f}ms')
+    for name, us in sorted(packages.items(), key=lambda x: -x[1])[:8]:
+        print(f'    {name:<24} {us / 1000:.1f}ms')
+    print(f'    加载时导入的重量级依赖: {", ".join(results[-1]["loaded"]) or "无"}')
+
+
+if __name__ == '__main__':
+    main()
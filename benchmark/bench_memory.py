@@ -0,0 +1,145 @@
+"""
+一级菜单合成峰值内存基准测试
+对比原合成方式（每组表格、多组拼接、注释各自生成中间图片后再粘贴到底版）与逐行直接绘制到最终底版的峰值内存，
+并检查两者生成的图片逐像素一致
+每种情况在独立子进程中渲染，以进程最大常驻内存（ru_maxrss，仅限 Unix）在渲染前后的增量作为峰值内存
+
+用法: python benchmark/bench_memory.py <字体路径> [分组数量]
+"""
+import contextlib
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ROWS = (100, 300, 1000)
+
+
+def make_data(count, seed=0):
+    rand = random.Random(seed)
+    words = ['menu', 'plugin', 'image', 'render', 'cache', 'group', 'daily', 'sign', 'music', 'search']
+    names = [f'plugin_{x:04d}' for x in range(count)]
+    descriptions = [' '.join(rand.choice(words) for _ in range(rand.randint(2, 40))) for _ in range(count)]
+    return names, descriptions
+
+
+def load_templates():
+    import nonebot
+    nonebot.init(driver='~none')
+    sys.path.insert(0, str(ROOT))
+    from PIL import Image
+    from nonebot_plugin_PicMenu.img_tool import ImageFactory, Box, simple_text, multi_text, auto_resize_text
+    from nonebot_plugin_PicMenu.template import DefaultTemplate
+
+    class LegacyTemplate(DefaultTemplate):  # 原合成方式，测量与单元格绘制沿用 DefaultTemplate
+        def generate_main_menu(self, data, start=1, page=None, columns=1):
+            description_layouts, row_height_list, col_max_width_tuple = self.measure_main_menu(data, start)
+            table_width = sum(col_max_width_tuple) + 3
+            groups = self.split_rows(row_height_list[1:], max(1, min(columns, len(data[0]))))
+            tables = []
+            for rows in groups:
+                table = ImageFactory(Image.new(
+                    'RGBA', (table_width, row_height_list[0] + sum(row_height_list[x + 1] for x in rows) + 3),
+                    self.colors['white']))
+                self.draw_main_menu_table(table, (0, 0), data, start, rows, row_height_list, col_max_width_tuple,
+                                          description_layouts)
+                tables.append(table)
+            if len(tables) == 1:
+                table = tables[0]
+            else:
+                table = ImageFactory(Image.new(
+                    'RGBA',
+                    (sum(x.img.size[0] for x in tables) + self.main_menu_group_gap * (len(tables) - 1),
+                     max(x.img.size[1] for x in tables)),
+                    self.colors['white']))
+                pos_x = 0
+                for x in tables:
+                    table.img_paste(x.img, (pos_x, 0))
+                    pos_x += x.img.size[0] + self.main_menu_group_gap
+                table_width = table.img.size[0]
+            table_size = table.img.size
+            note_basic_text = simple_text('注：', size=self.basic_font_size, color=self.colors['blue'],
+                                          font=self.using_font)
+            note_text = multi_text('查询菜单的详细使用方法请发送\n[菜单 PicMenu]',
+                                   box_size=(table_size[0] - 30 - note_basic_text.size[0] - 10, 0),
+                                   default_font=self.using_font, default_color=self.colors['blue'],
+                                   default_size=self.basic_font_size, spacing=4, horizontal_align="middle")
+            note_img = ImageFactory(Image.new(
+                'RGBA',
+                (note_text.size[0] + 10 + note_basic_text.size[0], max((note_text.size[1], note_basic_text.size[1]))),
+                self.colors['white']))
+            note_img.img_paste(note_basic_text, (0, 0), isalpha=True)
+            note_img.img_paste(note_text, (note_basic_text.size[0] + 10, 0), isalpha=True)
+            note_height = note_img.img.size[1]
+            main_menu = ImageFactory(Image.new(
+                'RGBA', (table_size[0] + 140, table_size[1] + note_height + 210), color=self.colors['white']))
+            main_menu.img_paste(note_img.img, main_menu.align_box('self', table.img, pos=(0, 140), align='horizontal'))
+            main_menu.img_paste(table.img, main_menu.align_box('self', table.img, pos=(0, 160 + note_height),
+                                                               align='horizontal'))
+            main_menu.add_box('border_box',
+                              main_menu.align_box('self', (table_size[0] + 40, table_size[1] + note_height + 80),
+                                                  pos=(0, 100), align='horizontal'),
+                              (table_size[0] + 40, table_size[1] + note_height + 90))
+            main_menu.rectangle('border_box', outline=self.colors['blue'], width=5)
+            top_left = main_menu.boxes['border_box'].topLeft
+            main_menu.rectangle(Box((top_left[0] - 25, top_left[1] - 25), (50, 50)),
+                                outline=self.colors['yellow'], width=5)
+            main_menu.add_box('title_box', (0, 0), (main_menu.get_size()[0], 100))
+            title = auto_resize_text('插件菜单', 60, self.using_font, (table_width - 60, 66), self.colors['blue'])
+            main_menu.img_paste(title, main_menu.align_box('title_box', title, align='center'), isalpha=True)
+            return main_menu.img
+
+    return {'legacy': LegacyTemplate, 'strip': DefaultTemplate}
+
+
+def child(rows, mode, columns):
+    templates = load_templates()
+    template = templates[mode]()
+    data = make_data(rows)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(os.devnull, 'w') as fp, contextlib.redirect_stdout(fp):  # 屏蔽模板的调试输出
+        img = template.generate_main_menu(data, columns=columns)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    digest = hashlib.md5(img.tobytes()).hexdigest()
+    print(json.dumps({'size': img.size, 'peak': peak * 1024, 'digest': digest}))
+
+
+def run(rows, mode, columns, workdir):
+    result = subprocess.run([sys.executable, __file__, '--child', str(rows), mode, str(columns)],
+                            cwd=workdir, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+        return
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    font = str(Path(sys.argv[1]).resolve())
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    with tempfile.TemporaryDirectory() as workdir:
+        (Path(workdir) / 'menu_config').mkdir()
+        with (Path(workdir) / 'menu_config' / 'config.json').open('w', encoding='utf-8') as fp:
+            json.dump({'default': font}, fp)
+        for rows in ROWS:
+            legacy = run(rows, 'legacy', columns, workdir)
+            strip = run(rows, 'strip', columns, workdir)
+            image_bytes = strip['size'][0] * strip['size'][1] * 4
+            same = legacy['digest'] == strip['digest']
+            print(f'{rows:>4} 行 {strip["size"][0]}x{strip["size"][1]} (图片 {image_bytes / 2 ** 20:.1f}MB): '
+                  f'原合成峰值 {legacy["peak"] / 2 ** 20:.1f}MB ({legacy["peak"] / image_bytes:.2f}x), '
+                  f'逐行合成峰值 {strip["peak"] / 2 ** 20:.1f}MB ({strip["peak"] / image_bytes:.2f}x), 结果一致: {same}')
+            if not same:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
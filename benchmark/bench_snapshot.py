@@ -0,0 +1,108 @@
+"""
+菜单数据启动加载基准测试
+对比完整加载（扫描、读取、解析、校验、排序、建立索引）与指纹一致时从快照加载的耗时，
+并检查两者得到的插件列表、一级菜单数据及查询结果一致
+一半插件的菜单数据来自 menu_config/menus 中的json文件，另一半来自 __plugin_meta__.extra['menu_data']
+
+用法: python benchmark/bench_snapshot.py [重复次数]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+COUNTS = (50, 200, 1000)
+WORDS = ['menu', 'sign', 'daily', 'music', 'search', 'image', 'weather', 'github', 'bilibili', 'translate',
+         'roll', 'poke', 'help', 'status', 'admin', 'group', 'word', 'cloud', 'answer', 'repeat', 'wiki']
+
+
+def make_funcs(rand):
+    return [{'func': f'{rand.choice(WORDS)}_{i}', 'trigger_condition': ' '.join(rand.sample(WORDS, 3)),
+             'trigger_method': 'on_command', 'brief_des': ' '.join(rand.sample(WORDS, 4)),
+             'detail_des': ' '.join(rand.choice(WORDS) for _ in range(30))}
+            for i in range(rand.randint(1, 8))]
+
+
+def make_plugins(count, menus_path, seed=0):  # 返回与 nonebot 的插件对象具有相同属性的对象
+    from nonebot.plugin import PluginMetadata
+    rand = random.Random(seed)
+    plugins = []
+    for i in range(count):
+        name = f'plugin_{i:04d}_{rand.choice(WORDS)}'
+        data = {'name': name, 'description': ' '.join(rand.sample(WORDS, 5)), 'usage': 'usage',
+                'funcs': make_funcs(rand)}
+        if i % 2:
+            with (menus_path / f'{name}.json').open('w', encoding='utf-8') as fp:
+                json.dump(data, fp, ensure_ascii=False)
+            metadata = None
+        else:
+            metadata = PluginMetadata(name=name, description=data['description'], usage=data['usage'],
+                                      extra={'menu_data': data['funcs']})
+        plugins.append(SimpleNamespace(name=name, metadata=metadata))
+    return plugins
+
+
+def load(manager, snapshot_path):
+    data_manager = manager.DataManager()
+    data_manager.snapshot_path = snapshot_path
+    start = time.perf_counter()
+    data_manager.load_plugin_info()
+    return time.perf_counter() - start, data_manager
+
+
+def summary(data_manager, queries):
+    index = data_manager.index
+    return ([x.dict() for x in index.plugins], index.main_menu_data,
+            [data_manager.resolve(*x)[1] for x in queries])
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    (Path('menu_config') / 'menus').mkdir(parents=True)
+    with (Path('menu_config') / 'config.json').open('w', encoding='utf-8') as fp:
+        json.dump({}, fp)
+    sys.path.insert(0, str(ROOT))
+    warnings.filterwarnings('ignore')  # 未安装 python-Levenshtein 的提示
+    import nonebot
+    import nonebot.plugin
+    from nonebot import logger
+    nonebot.init(driver='~none')
+    from nonebot_plugin_PicMenu import manager
+    logger.remove()  # 屏蔽逐个插件的加载日志
+    snapshot_path = Path.cwd() / 'menu_config' / 'cache' / manager.SNAPSHOT_FILE
+    for count in COUNTS:
+        for file in (Path('menu_config') / 'menus').iterdir():
+            file.unlink()
+        plugins = make_plugins(count, Path('menu_config') / 'menus')
+        nonebot.plugin.get_loaded_plugins = lambda: plugins
+        rand = random.Random(count)
+        queries = [(x.name[:12], None) for x in rand.sample(plugins, 20)] + \
+                  [(str(rand.randint(1, count)), str(rand.randint(1, 3))) for _ in range(20)]
+        cold = min(load(manager, None)[0] for _ in range(repeat))
+        cold_result = summary(load(manager, None)[1], queries)
+        if snapshot_path.exists():
+            snapshot_path.unlink()
+        write = load(manager, snapshot_path)[0]  # 完整加载并写入快照
+        snapshot = min(load(manager, snapshot_path)[0] for _ in range(repeat))
+        snapshot_manager = load(manager, snapshot_path)[1]
+        same = summary(snapshot_manager, queries) == cold_result and 'snapshot' in snapshot_manager.load_timings \
+            and 'validate' not in snapshot_manager.load_timings
+        print(f'{count:>5} 个插件: 完整加载 {cold * 1000:.1f}ms, 完整加载并写入快照 {write * 1000:.1f}ms, '
+              f'快照加载 {snapshot * 1000:.1f}ms, 加速 {cold / snapshot:.1f}x, '
+              f'快照 {snapshot_path.stat().st_size / 1024:.0f}KB, 结果一致: {same}')
+        if not same:
+            sys.exit(1)
+    os.chdir(ROOT)
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+multi_text 自动换行基准测试
+对比逐字符测量换行与字符宽度表+二分查找换行的耗时，并检查两者换行结果一致
+
+用法: python benchmark/bench_wrap.py <字体路径> [重复次数]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nonebot  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+nonebot.init(driver='~none')  # 导入插件包前需初始化 nonebot
+with tempfile.TemporaryDirectory() as workdir:  # 导入插件包时会在工作目录下创建 menu_config
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from nonebot_plugin_PicMenu.img_tool import TextRun, get_font, wrap_lines  # noqa: E402
+    finally:
+        os.chdir(cwd)
+
+
+def legacy_wrap_lines(total_lines, max_width):  # 原实现：逐字符调用 getlength
+    new_total_lines = []
+    for line in total_lines:
+        new_line = []
+        new_line_width = 0
+        new_piece_cha_list = []
+        for i, piece in enumerate(line):
+            using_font = get_font(piece.fonts, piece.size)
+            for cha in piece.text:
+                cha_width = using_font.getlength(cha)
+                new_line_width += cha_width
+                if new_line_width <= max_width:
+                    new_piece_cha_list.append(cha)
+                else:
+                    new_line.append(piece._replace(text=''.join(new_piece_cha_list)))
+                    new_total_lines.append(new_line)
+                    new_line = []
+                    new_line_width = cha_width
+                    new_piece_cha_list = [cha]
+            new_line.append(piece._replace(text=''.join(new_piece_cha_list)))
+            new_piece_cha_list = []
+            if i == len(line) - 1:
+                new_total_lines.append(new_line)
+    return new_total_lines
+
+
+def make_lines(font, count, seed=0):
+    rand = random.Random(seed)
+    # 常用汉字、标点、字母与数字混排
+    charset = [chr(x) for x in range(0x4e00, 0x4e00 + 3000)] + list('，。！？、：；') + \
+              list('abcdefghijklmnopqrstuvwxyz0123456789 ')
+    lines = []
+    for _ in range(count):
+        line = []
+        for _ in range(rand.randint(1, 3)):
+            text = ''.join(rand.choice(charset) for _ in range(rand.randint(0, 300)))
+            line.append(TextRun(font, rand.choice((20, 30, 40)), 'black', 0, 'black', text))
+        lines.append(line)
+    return lines
+
+
+def bench(func, lines, max_width, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(lines, max_width)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    font = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    lines = make_lines(font, 200)
+    chars = sum(len(piece.text) for line in lines for piece in line)
+    for max_width in (1, 300, 800):
+        wrap_lines(lines, max_width)  # 预热字体与宽度表
+        legacy_result, legacy_time = bench(legacy_wrap_lines, lines, max_width, repeat)
+        new_result, new_time = bench(wrap_lines, lines, max_width, repeat)
+        same = legacy_result == new_result
+        print(f'宽度 {max_width:>4}: {chars} 字符, {len(new_result)} 行, '
+              f'逐字符 {legacy_time * 1000:.1f}ms, 宽度表 {new_time * 1000:.1f}ms, '
+              f'加速 {legacy_time / new_time:.1f}x, 结果一致: {same}')
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
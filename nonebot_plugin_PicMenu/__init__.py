@@ -1,5 +1,5 @@
 import re
-import logging
+import asyncio
 
 from nonebot import get_driver
 from nonebot.matcher import Matcher
@@ -9,28 +9,35 @@ from nonebot.adapters.onebot.v11 import Event
 from nonebot.adapters.onebot.v11.message import MessageSegment
 from nonebot.permission import SUPERUSER
 from nonebot.adapters.onebot.v11.permission import GROUP_ADMIN
-from nonebot import logger
-
-# 使用 nonebot 的 logger 输出调试信息
-# nonebot 的 logger 不支持 setLevel 方法
-# 我们使用 logger.opt(colors=True).debug() 来输出调试信息
 
+from .config import Config
 from .manager import MenuManager
-from .img_tool import img2b64
 from .metadata import __plugin_meta__
+from .trace import get_tracer
+
+trace_handler = get_tracer('handler')
 
 
 driver = get_driver()
+plugin_config = Config.parse_obj(driver.config.dict())
+warm_up_task = None
+watch_task = None
 @driver.on_bot_connect
 async def _():
-    print("[DEBUG] 机器人连接事件触发")
+    if trace_handler.enabled:
+        trace_handler.emit('bot_connect', loaded=len(menu_manager.data_manager.plugin_menu_data_list))
     if not menu_manager.data_manager.plugin_menu_data_list:
-        print("[DEBUG] 插件菜单数据列表为空，开始加载插件信息")
         menu_manager.load_plugin_info()
-    else:
-        print(f"[DEBUG] 插件菜单数据列表不为空，已加载 {len(menu_manager.data_manager.plugin_menu_data_list)} 个插件的菜单数据")
+        if plugin_config.menu_warm_up:
+            # 保存任务引用，防止后台任务被回收
+            global warm_up_task
+            warm_up_task = asyncio.create_task(menu_manager.warm_up())
+        if plugin_config.menu_watch_interval > 0:
+            global watch_task
+            watch_task = asyncio.create_task(menu_manager.watch())
 
-menu_manager = MenuManager()
+menu_manager = MenuManager(plugin_config)
+driver.on_shutdown(menu_manager.shutdown)
 menu = on_startswith('菜单', priority=5)
 switch = on_fullmatch('开关菜单', permission=SUPERUSER | GROUP_ADMIN, priority=5)
 
@@ -51,19 +58,16 @@ async def check_switch(matcher: Matcher):
 
 @menu.handle()
 async def _(event: Event, check=Depends(check_switch)):
-    print("[DEBUG] 菜单命令触发")
     msg = str(event.get_message())
-    print(f"[DEBUG] 收到消息: {msg}")
     if match_result := re.match(r'^菜单 (.*?) (.*?)$|^/菜单 (.*?) (.*?)$', msg):
-        print("[DEBUG] 匹配到三级菜单模式")
         result = [x for x in match_result.groups() if x is not None]
         plugin_name = result[0]
         cmd = result[1]
-        print(f"[DEBUG] 插件名: {plugin_name}, 命令: {cmd}")
-        temp = menu_manager.generate_func_details_image(plugin_name, cmd)
-        print(f"[DEBUG] 生成的图片类型: {type(temp)}")
+        temp = await menu_manager.run_sync(menu_manager.get_menu, plugin_name, cmd)
+        if trace_handler.enabled:
+            trace_handler.emit('menu', level='func', message=msg, plugin=plugin_name, func=cmd,
+                               result=temp if isinstance(temp, str) else 'image')
         if isinstance(temp, str):
-            print(f"[DEBUG] 生成图片失败, 错误信息: {temp}")
             if temp == 'PluginIndexOutRange':
                 await menu.finish(MessageSegment.text('插件序号不存在'))
             elif temp == 'CannotMatchPlugin':
@@ -75,28 +79,25 @@ async def _(event: Event, check=Depends(check_switch)):
             else:
                 await menu.finish(MessageSegment.text('命令过于模糊或不存在'))
         else:
-            print("[DEBUG] 生成图片成功, 返回图片")
-            await menu.finish(MessageSegment.image('base64://' + img2b64(temp)))
+            await menu.finish(MessageSegment.image(temp.payload))
     elif match_result := re.match(r'^菜单 (.*)$|^/菜单 (.*)$', msg):
-        print("[DEBUG] 匹配到二级菜单模式")
         result = [x for x in match_result.groups() if x is not None]
         plugin_name = result[0]
-        print(f"[DEBUG] 插件名: {plugin_name}")
-        temp = menu_manager.generate_plugin_menu_image(plugin_name)
-        print(f"[DEBUG] 生成的图片类型: {type(temp)}")
+        temp = await menu_manager.run_sync(menu_manager.get_menu, plugin_name)
+        if trace_handler.enabled:
+            trace_handler.emit('menu', level='plugin', message=msg, plugin=plugin_name,
+                               result=temp if isinstance(temp, str) else 'image')
         if isinstance(temp, str):
-            print(f"[DEBUG] 生成图片失败, 错误信息: {temp}")
             if temp == 'PluginIndexOutRange':
                 await menu.finish(MessageSegment.text('插件序号不存在'))
+            elif temp == 'PageOutRange':
+                await menu.finish(MessageSegment.text('页码不存在'))
             else:
                 await menu.finish(MessageSegment.text('插件名过于模糊或不存在'))
         else:
-            print("[DEBUG] 生成图片成功, 返回图片")
-            await menu.finish(MessageSegment.image('base64://' + img2b64(temp)))
+            await menu.finish(MessageSegment.image(temp.payload))
     else:
-        print("[DEBUG] 匹配到一级菜单模式")
-        print("[DEBUG] 开始生成主菜单图片")
-        img = menu_manager.generate_main_menu_image()
-        print(f"[DEBUG] 生成的图片类型: {type(img)}")
-        print("[DEBUG] 生成图片成功, 返回图片")
-        await menu.finish(MessageSegment.image('base64://' + img2b64(img)))
+        img = await menu_manager.run_sync(menu_manager.get_menu)
+        if trace_handler.enabled:
+            trace_handler.emit('menu', level='main', message=msg)
+        await menu.finish(MessageSegment.image(img.payload))
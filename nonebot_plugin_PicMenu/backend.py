@@ -0,0 +1,202 @@
+import math
+import os
+import time
+import threading
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple
+
+from nonebot import logger
+
+from .data_struct import PluginMenuData
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from PIL.Image import Image as Img
+    from .img_tool import ImageEncoder
+
+
+class MenuTask(NamedTuple):  # 一次菜单渲染任务，只包含可在进程间传递的基础数据
+    level: str  # 菜单级别: main / plugin / func
+    plugin_index: Optional[int]  # 插件在插件列表中的位置
+    func_index: Optional[int]  # 功能在插件功能列表中的位置
+    plugin_name: Optional[str]
+    template: str
+    data_version: int
+    page: int = 0  # 一级菜单页码，从1开始，为0时不分页
+    page_size: int = 0  # 一级菜单每页行数
+    columns: int = 1  # 一级菜单数据行分组数量，为0时自动选择
+
+    @property
+    def key(self) -> tuple:
+        """
+        渲染缓存键（菜单级别，插件位置，功能序号，模板名，数据版本，页码）
+        插件名只用于显示，可能重复，使用插件在插件列表中的位置区分插件
+        """
+        return self.level, self.plugin_index, self.func_index, self.template, self.data_version, self.page
+
+
+def page_count(plugin_count: int, page_size: int) -> int:
+    """
+    说明: 计算一级菜单页数
+    :param plugin_count: 可见插件数量
+    :param page_size: 每页行数，为0时不分页
+    :return: 页数，至少为1
+    """
+    if page_size <= 0:
+        return 1
+    return max(1, math.ceil(plugin_count / page_size))
+
+
+def render_task(task: MenuTask, plugin_menu_data_list: List[PluginMenuData], template_manager) -> 'Img':
+    """
+    说明:
+        根据渲染任务生成菜单图片
+    参数:
+        :param task: MenuTask对象
+        :param plugin_menu_data_list: 生成任务时的插件列表
+        :param template_manager: TemplateManager对象
+        :return: Image对象
+    """
+    template = template_manager.select_template(task.template)
+    if task.level == 'main':
+        visible_plugins = [plugin for plugin in plugin_menu_data_list if plugin.visible]
+        kwargs = {} if task.columns == 1 else {'columns': task.columns}
+        if task.page > 0:  # 只渲染请求的一页，序号保持全局编号
+            start = (task.page - 1) * task.page_size
+            kwargs.update(start=start + 1, page=(task.page, page_count(len(visible_plugins), task.page_size)))
+            visible_plugins = visible_plugins[start:start + task.page_size]
+        data = ([plugin.name for plugin in visible_plugins], [plugin.description for plugin in visible_plugins])
+        return template().generate_main_menu(data, **kwargs)
+    plugin_data = plugin_menu_data_list[task.plugin_index]
+    if task.level == 'plugin':
+        if plugin_data.funcs is not None:
+            return template().generate_plugin_menu(plugin_data)
+        else:
+            return template().generate_original_plugin_menu(plugin_data)
+    return template().generate_command_details(plugin_data.funcs[task.func_index])
+
+
+# 渲染进程内的数据：（插件列表，模板管理器，编码器）
+_worker_data = None
+
+
+def _init_worker(plugin_menu_data_list: List[PluginMenuData], encoder: 'ImageEncoder'):
+    """
+    渲染进程初始化，保存插件数据快照并预加载模板及字体
+    """
+    global _worker_data
+    from .img_tool import get_font  # 字体注册表及文本图片缓存的锁在 fork 后由 img_tool 重新创建
+    from .manager import TemplateManager
+    from .template import DefaultTemplate
+    template_manager = TemplateManager()
+    template_manager.load_templates()
+    _worker_data = (plugin_menu_data_list, template_manager, encoder)
+    template = DefaultTemplate()
+    try:
+        get_font(template.using_font, template.basic_font_size)
+    except OSError:  # 字体未配置时在渲染时报错
+        pass
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _render_in_worker(task: MenuTask) -> Tuple[bytes, str, float]:
+    plugin_menu_data_list, template_manager, encoder = _worker_data
+    img = render_task(task, plugin_menu_data_list, template_manager)
+    start = time.perf_counter()
+    data, fmt = encoder.encode(img)
+    return data, fmt, time.perf_counter() - start
+
+
+class ProcessRenderPool(object):
+    def __init__(self, workers: int = 0, timeout: float = 30):
+        """
+        说明:
+            多进程渲染后端，渲染进程在插件信息加载后fork，并持有插件数据快照
+            渲染进程直接返回编码后的图片数据
+        参数:
+            :param workers: 渲染进程数量，不大于0时使用CPU核心数
+            :param timeout: 等待单次渲染的最长时间（秒），超时后结束并重建渲染进程，不大于0时不限制
+        """
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.timeout = timeout if timeout > 0 else None
+        self.data_version = None  # 渲染进程持有的数据版本
+        self._plugin_menu_data_list: List[PluginMenuData] = []
+        self._encoder: Optional['ImageEncoder'] = None  # 启动渲染进程时设置
+        self._executor: Optional['ProcessPoolExecutor'] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        """
+        说明: 当前平台是否支持fork方式创建渲染进程
+        """
+        import multiprocessing
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def start(self, plugin_menu_data_list: List[PluginMenuData], data_version: int, encoder: 'ImageEncoder'):
+        """
+        说明: 使用新的插件数据重新创建渲染进程
+        :param plugin_menu_data_list: 插件列表
+        :param data_version: 数据版本
+        :param encoder: 图片编码器
+        """
+        with self._lock:
+            self._plugin_menu_data_list = plugin_menu_data_list
+            self._encoder = encoder
+            self.data_version = data_version
+            self._restart()
+
+    def _restart(self, terminate: bool = False):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        if self._executor is not None:
+            if terminate:  # 卡住的渲染进程不会自行退出
+                for process in list((self._executor._processes or {}).values()):
+                    process.terminate()
+            self._executor.shutdown(wait=False)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('fork'),
+                                             initializer=_init_worker,
+                                             initargs=(self._plugin_menu_data_list, self._encoder))
+        self._executor.submit(_worker_ready)  # 立即创建渲染进程
+
+    def render(self, task: MenuTask) -> Optional[Tuple[bytes, str, float]]:
+        """
+        说明: 在渲染进程中执行任务，渲染进程崩溃时重建进程池并重试一次，
+            渲染超时时结束并重建渲染进程，不再重试
+        :param task: MenuTask对象
+        :return: 元组（编码后的图片数据，格式，编码耗时），任务与渲染进程数据版本不一致时返回None
+        :raise TimeoutError: 渲染超时，导致渲染进程卡住的任务不应再在其他线程中渲染
+        """
+        from concurrent.futures import TimeoutError
+        from concurrent.futures.process import BrokenProcessPool
+        for _ in range(2):
+            with self._lock:
+                if self._executor is None or task.data_version != self.data_version:
+                    return None
+                executor = self._executor
+            try:
+                return executor.submit(_render_in_worker, task).result(timeout=self.timeout)
+            except BrokenProcessPool:
+                logger.warning('菜单渲染进程异常退出，正在重建渲染进程')
+                with self._lock:
+                    if self._executor is executor:
+                        self._restart()
+            except TimeoutError:
+                logger.warning(f'菜单渲染进程 {self.timeout}s 内未返回结果，正在重建渲染进程')
+                with self._lock:
+                    if self._executor is executor:
+                        self._restart(terminate=True)
+                raise
+        return None
+
+    def shutdown(self):
+        """
+        说明: 关闭渲染进程
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,339 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Optional, Union
+
+if TYPE_CHECKING:
+    from PIL.Image import Image as Img
+
+
+class CacheEntry(object):
+    __slots__ = ('img', 'data', 'payload', 'size')
+
+    def __init__(self, img: Optional['Img'] = None, data: Optional[bytes] = None):
+        """
+        说明:
+            渲染缓存条目，保存图片、编码后的图片数据及发送用的图片（base64字符串/文件路径/图片数据）
+            由渲染进程生成的条目只有编码后的图片数据，没有Image对象
+        参数:
+            :param img: Image对象
+            :param data: 编码后的图片数据
+        """
+        self.img = img
+        self.data = data
+        self.payload: Union[str, Path, bytes, None] = None
+        self.size = (RenderCache.image_bytes(img) if img is not None else 0) + (len(data) if data else 0)
+
+
+class RenderCache(object):
+    def __init__(self, max_entries: int = 64, max_memory: int = 256):
+        """
+        说明:
+            已渲染菜单图片的LRU缓存，同时限制缓存数量与内存占用，可在多个渲染线程中使用
+        参数:
+            :param max_entries: 最大缓存数量
+            :param max_memory: 内存占用上限（MB）
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_memory * 1024 * 1024
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self.memory = 0  # 当前缓存条目占用的字节数
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def image_bytes(img: 'Img') -> int:
+        """
+        说明: 估算图片像素数据占用的字节数
+        :param img: Image对象
+        :return: 字节数
+        """
+        return img.size[0] * img.size[1] * len(img.getbands())
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """
+        说明: 获取缓存条目，命中时将其移至队尾
+        :param key: 缓存键
+        :return: CacheEntry对象，未命中返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: CacheEntry):
+        """
+        说明: 写入缓存，超出数量或内存上限时淘汰最久未使用的条目
+        :param key: 缓存键
+        :param entry: CacheEntry对象
+        """
+        if entry.size > self.max_bytes or self.max_entries <= 0:  # 单张超限则不缓存
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.memory += entry.size
+            self._evict()
+
+    def set_payload(self, key: Hashable, entry: CacheEntry, payload: Union[str, Path, bytes]):
+        """
+        说明: 为缓存条目保存发送用的图片，条目已被淘汰时只修改条目本身
+        :param key: 缓存键
+        :param entry: CacheEntry对象
+        :param payload: base64字符串/文件路径/图片数据
+        """
+        # 文件路径及与条目共用的图片数据不额外占用内存
+        size = len(payload) if isinstance(payload, str) else 0
+        with self._lock:
+            if entry.payload is not None:
+                return
+            entry.payload = payload
+            entry.size += size
+            if self._entries.get(key) is entry:
+                self.memory += size
+                self._evict()
+
+    def rekey(self, func: Callable[[Hashable], Optional[Hashable]]) -> int:
+        """
+        说明: 按顺序修改所有条目的缓存键，保持淘汰顺序不变，用于数据更新后保留未受影响的条目
+        :param func: 参数为原缓存键，返回新缓存键，返回None时删除该条目
+        :return: 缓存键被修改的条目数量
+        """
+        with self._lock:
+            entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+            moved = 0
+            for key, entry in self._entries.items():
+                new_key = func(key)
+                # 新缓存键已有条目时保留已有的条目
+                if new_key is None or new_key in entries or (new_key != key and new_key in self._entries):
+                    self.memory -= entry.size
+                    continue
+                moved += new_key != key
+                entries[new_key] = entry
+            self._entries = entries
+            return moved
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.memory -= entry.size
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self.memory > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        说明: 清空缓存
+        """
+        with self._lock:
+            self._entries.clear()
+            self.memory = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        说明: 缓存统计信息
+        :return: 字典（数量，内存占用，命中数，未命中数）
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory': self.memory,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class QueryCache(object):
+    def __init__(self, max_entries: int = 256):
+        """
+        说明:
+            查询解析结果的LRU缓存，保存原始查询到解析结果（插件及功能的位置，或异常字符串）的映射
+            只保存当前数据版本的结果，重新加载插件信息时清空，可在多个渲染线程中使用
+        参数:
+            :param max_entries: 最大缓存数量
+        """
+        self.max_entries = max_entries
+        self.version = 0  # 当前数据版本号
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, version: int, key: Hashable) -> Any:
+        """
+        说明: 获取解析结果，命中时将其移至队尾
+        :param version: 解析时使用的数据版本号
+        :param key: 原始查询
+        :return: 解析结果，未命中或版本不一致返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key) if version == self.version else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version: int, key: Hashable, value: Any):
+        """
+        说明: 写入解析结果，版本不一致时忽略，超出数量上限时淘汰最久未使用的结果
+        :param version: 解析时使用的数据版本号
+        :param key: 原始查询
+        :param value: 解析结果
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self.version:  # 解析期间插件信息已重新加载
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def reset(self, version: int):
+        """
+        说明: 清空缓存并切换到新的数据版本
+        :param version: 新的数据版本号
+        """
+        with self._lock:
+            self.version = version
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        说明: 缓存统计信息
+        :return: 字典（数量，命中数，未命中数）
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class DiskCache(object):
+    def __init__(self, path: Path, max_size: int = 512, max_age: int = 7):
+        """
+        说明:
+            按内容寻址的磁盘渲染缓存，文件名为缓存键（内容哈希），bot重启后仍然有效
+            写入时先写临时文件再原子替换，多个bot进程可共用同一缓存目录
+        参数:
+            :param path: 缓存目录
+            :param max_size: 缓存目录大小上限（MB）
+            :param max_age: 缓存文件最长保留天数
+        """
+        self.path = path
+        self.max_bytes = max_size * 1024 * 1024
+        self.max_age = max_age * 24 * 3600
+        self.total = 0  # 估算的缓存目录大小
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / key
+
+    def file(self, key: str, data: bytes) -> Optional[Path]:
+        """
+        说明: 获取保存了指定数据的缓存文件，文件已存在时只刷新修改时间，否则写入
+        :param key: 缓存键（可带扩展名）
+        :param data: 缓存数据
+        :return: 文件路径，写入失败返回None
+        """
+        file = self._file(key)
+        try:
+            os.utime(file)
+            return file
+        except OSError:
+            pass
+        self.put(key, data)
+        return file if file.exists() else None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        说明: 读取缓存数据，命中时刷新文件修改时间
+        :param key: 缓存键
+        :return: 缓存数据，未命中返回None
+        """
+        file = self._file(key)
+        try:
+            data = file.read_bytes()
+            os.utime(file)
+        except OSError:  # 不存在或已被其他进程清理
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        """
+        说明: 原子写入缓存数据，超出大小上限时清理缓存
+        :param key: 缓存键
+        :param data: 缓存数据
+        """
+        file = self._file(key)
+        try:
+            file.parent.mkdir(exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=file.parent, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    fp.write(data)
+                os.replace(tmp_path, file)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError:  # 写入失败不影响菜单发送
+            return
+        with self._lock:
+            self.total += len(data)
+            need_gc = self.total > self.max_bytes
+        if need_gc:
+            self.gc()
+
+    def gc(self):
+        """
+        说明: 删除过期的缓存文件，总大小超出上限时从最久未使用的文件开始删除
+        """
+        now = time.time()
+        files = []
+        for file in self.path.glob('*/*'):
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            # 过期文件及残留的临时文件
+            if now - stat.st_mtime > self.max_age or (file.name.startswith('.tmp-') and now - stat.st_mtime > 3600):
+                self._unlink(file)
+            elif not file.name.startswith('.tmp-'):
+                files.append((stat.st_mtime, stat.st_size, file))
+        files.sort()
+        total = sum(x[1] for x in files)
+        for _, size, file in files:
+            if total <= self.max_bytes:
+                break
+            self._unlink(file)
+            total -= size
+        with self._lock:
+            self.total = total
+
+    @staticmethod
+    def _unlink(file: Path):
+        try:
+            file.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+
+
+# 插件配置，从 nonebot 的 .env 文件中读取
+class Config(BaseModel):
+    menu_cache_size: int = 64  # 渲染缓存最多保存的菜单图片数量
+    menu_cache_memory: int = 256  # 渲染缓存占用内存上限（MB）
+    menu_font_cache_size: int = 32  # 字体注册表最多保存的字体对象数量
+    menu_text_cache_size: int = 512  # 单行文本图片缓存最多保存的图片数量
+    menu_query_cache_size: int = 256  # 查询解析结果缓存最多保存的查询数量
+    menu_render_workers: int = 2  # 渲染线程数量
+    menu_render_backend: str = 'thread'  # 渲染后端: thread / process
+    menu_render_processes: int = 0  # 多进程后端的渲染进程数量，不大于0时使用CPU核心数
+    menu_render_timeout: float = 30  # 多进程后端单次渲染的超时时间（秒），超时后重建渲染进程，为0时不限制
+    menu_disk_cache: bool = True  # 是否启用 menu_config/cache 磁盘缓存
+    menu_disk_cache_size: int = 512  # 磁盘缓存大小上限（MB）
+    menu_disk_cache_days: int = 7  # 磁盘缓存文件最长保留天数
+    menu_warm_up: bool = True  # 加载插件信息后是否在后台预渲染所有菜单
+    menu_warm_up_concurrency: int = 1  # 预渲染同时占用的渲染线程数量
+    menu_watch_interval: float = 0  # 检查 menu_config/menus 中json文件变化的间隔（秒），为0时不检查
+    menu_snapshot: bool = True  # 是否将校验后的菜单数据及索引保存为 menu_config/cache 中的快照，下次启动时直接加载
+    menu_image_format: str = 'png'  # 输出格式: png / png8 / webp / jpeg
+    menu_image_compress_level: int = 6  # 压缩等级，PNG为0-9，WebP为0-6
+    menu_image_quality: int = 85  # JPEG质量
+    menu_image_max_size: int = 0  # 图片大小预算（KB），超出时自动选择更小的编码方式，为0时不限制
+    menu_page_size: int = 0  # 一级菜单每页显示的插件数量，为0时不分页
+    menu_main_columns: int = 1  # 一级菜单表格分组并排显示的数量，为0时自动选择
+    menu_transport: str = 'base64'  # 图片发送方式: base64 / file / bytes
+    menu_transport_dir: str = ''  # file 方式保存图片的目录，为空时使用 menu_config/files
+    menu_trace: str = ''  # 开启调试追踪的子系统，逗号分隔: handler / data / template / text / all
+    menu_trace_sample: int = 1  # 调试追踪采样间隔，每N条输出一条
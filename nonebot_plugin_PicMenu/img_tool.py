@@ -1,17 +1,300 @@
 import _io
 import base64
+import os
 import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, Literal, Tuple, Union, List
+from typing import Dict, NamedTuple, Optional, Literal, Sequence, Tuple, Union, List
 
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, PngImagePlugin
+from PIL import Image, ImageDraw, ImageFont, ImageFilter, PngImagePlugin, features
 from PIL.Image import Image as Img
 
-# 使用 Python 标准日志模块
-import logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger('PicMenu')
+from .trace import get_tracer
+
+trace_text = get_tracer('text')
+
+
+class FontRegistry(object):
+    def __init__(self, max_fonts: int = 32):
+        """
+        说明:
+            进程级字体注册表，按（字体路径，字号，排版引擎）缓存FreeType字体对象，
+            避免重复打开和解析字体文件
+            FreeType字体对象不是线程安全的，每个线程持有各自的字体对象
+        参数:
+            :param max_fonts: 最多保存的字体对象数量，超出时淘汰最久未使用的字体
+        """
+        self.max_fonts = max_fonts
+        self._fonts: 'OrderedDict[tuple, ImageFont.FreeTypeFont]' = OrderedDict()
+        self._advances: 'OrderedDict[tuple, AdvanceTable]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self,
+            font: Union[str, Path],
+            size: int,
+            layout_engine: Optional[int] = None) -> ImageFont.FreeTypeFont:
+        """
+        说明: 获取字体对象，不存在时加载
+        :param font: 字体路径
+        :param size: 字号
+        :param layout_engine: 排版引擎，ImageFont.Layout.BASIC 或 ImageFont.Layout.RAQM
+        :return: FreeTypeFont对象
+        """
+        key = (str(font), size, layout_engine, threading.get_ident())
+        with self._lock:
+            using_font = self._fonts.get(key)
+            if using_font is not None:
+                self._fonts.move_to_end(key)
+                return using_font
+        using_font = ImageFont.truetype(font, size, layout_engine=layout_engine)
+        with self._lock:
+            self._fonts[key] = using_font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return using_font
+
+    def advance_table(self, font: Union[str, Path], size: int) -> 'AdvanceTable':
+        """
+        说明: 获取字符宽度表，字符宽度与线程无关，所有线程共用同一张表
+        :param font: 字体路径
+        :param size: 字号
+        :return: AdvanceTable对象
+        """
+        key = (str(font), size)
+        with self._lock:
+            table = self._advances.get(key)
+            if table is None:
+                table = AdvanceTable(font, size)
+                self._advances[key] = table
+                while len(self._advances) > self.max_fonts:
+                    self._advances.popitem(last=False)
+            else:
+                self._advances.move_to_end(key)
+            return table
+
+    def clear(self):
+        """
+        说明: 清空已加载的字体及字符宽度表
+        """
+        with self._lock:
+            self._fonts.clear()
+            self._advances.clear()
+
+    def stats(self) -> dict:
+        """
+        说明: 字体注册表统计信息，内存占用按字体文件大小估算
+        :return: 字典（字体对象数量，估算内存占用，字符宽度表数量）
+        """
+        with self._lock:
+            keys = list(self._fonts)
+            tables = len(self._advances)
+        memory = 0
+        for path in set(key[0] for key in keys):
+            try:
+                memory += os.path.getsize(path)
+            except OSError:  # 系统字体等无法直接定位的文件
+                pass
+        return {'fonts': len(keys), 'memory': memory, 'advance_tables': tables}
+
+
+font_registry = FontRegistry()
+
+
+def get_font(font: Union[str, Path],
+             size: int,
+             layout_engine: Optional[int] = None) -> ImageFont.FreeTypeFont:
+    """
+    说明:
+        从字体注册表获取字体对象
+    参数:
+        :param font: 字体路径
+        :param size: 字号
+        :param layout_engine: 排版引擎
+        :return: FreeTypeFont对象
+    """
+    return font_registry.get(font, size, layout_engine)
+
+
+class AdvanceTable(object):
+    __slots__ = ('font', 'size', 'widths')
+
+    def __init__(self, font: Union[str, Path], size: int):
+        """
+        说明:
+            单个字体、字号下的字符宽度表，首次遇到的字符通过FreeType测量后记录
+        参数:
+            :param font: 字体路径
+            :param size: 字号
+        """
+        self.font = font
+        self.size = size
+        self.widths: Dict[str, float] = {}
+
+    def measure(self, text: str) -> List[float]:
+        """
+        说明: 获取文本中每个字符的宽度
+        :param text: 文本
+        :return: 字符宽度列表
+        """
+        widths = self.widths
+        try:
+            return [widths[cha] for cha in text]
+        except KeyError:
+            pass
+        using_font = get_font(self.font, self.size)
+        for cha in set(text).difference(widths):
+            widths[cha] = using_font.getlength(cha)
+        return [widths[cha] for cha in text]
+
+
+def get_advance_table(font: Union[str, Path], size: int) -> AdvanceTable:
+    """
+    说明:
+        从字体注册表获取字符宽度表
+    参数:
+        :param font: 字体路径
+        :param size: 字号
+        :return: AdvanceTable对象
+    """
+    return font_registry.advance_table(font, size)
+
+
+class TextRun(NamedTuple):  # 富文本中样式相同的一段文本，字段顺序与富文本参数一致
+    fonts: str
+    size: int
+    color: Union[str, Tuple[int, ...]]
+    stroke_width: int
+    stroke_fill: Union[str, Tuple[int, ...]]
+    text: str
+
+
+RICH_TEXT_CACHE_SIZE = 1024  # 富文本解析结果最多缓存的数量
+_FT_PATTERN = re.compile(r"<ft(.*)>")
+_NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def _parse_color(value: str) -> Union[str, Tuple[int, ...]]:
+    # rgb/rgba 数值转为元组，否则视为颜色名或十六位颜色编码
+    rgba_result = _NUMBER_PATTERN.findall(value)
+    if len(rgba_result) in [3, 4]:
+        return tuple((int(x) for x in rgba_result))
+    return value
+
+
+@lru_cache(maxsize=RICH_TEXT_CACHE_SIZE)
+def _parse_rich_text(text: str,
+                     default_font: str,
+                     default_size: int,
+                     default_color: Union[str, Tuple[int, ...]],
+                     default_stroke_width: int,
+                     default_stroke_fill: Union[str, Tuple[int, ...]]) -> Tuple[Tuple[TextRun, ...], ...]:
+    default_run = TextRun(default_font, default_size, default_color, default_stroke_width, default_stroke_fill, '')
+    total_lines = []
+    # 分割换行符
+    for line in text.split('\n'):
+        line_pieces = []
+        # 根据特殊文本结束符号分片
+        for piece in line.split('</ft>'):
+            # 匹配<ft>中内容
+            a = _FT_PATTERN.search(piece)
+            if a:
+                # 匹配结果起始及结束下标
+                start, end = a.span()
+                params = {}
+                # 根据文本对参数赋值
+                for param in a.group(1).split():
+                    _param = param.split('=')
+                    if _param[0] == 'fonts':
+                        params['fonts'] = _param[1]
+                    elif _param[0] == 'size':
+                        params['size'] = int(_param[1])
+                    elif _param[0] == 'stroke_width':
+                        params['stroke_width'] = int(_param[1])
+                    elif _param[0] in ('color', 'stroke_fill'):
+                        params[_param[0]] = _parse_color(_param[1])
+                # 特殊文本外的结果储存
+                if piece[:start]:
+                    line_pieces.append(default_run._replace(text=piece[:start]))
+                # 特殊文本结果储存
+                line_pieces.append(default_run._replace(text=piece[end:], **params))
+            elif piece:
+                line_pieces.append(default_run._replace(text=piece))
+        # 总行储存
+        total_lines.append(tuple(line_pieces))
+    return tuple(total_lines)
+
+
+def parse_rich_text(text: str,
+                    default_font: str = 'SIMYOU.TTF',
+                    default_size: int = 20,
+                    default_color: Union[str, Tuple[int, int, int], Tuple[int, int, int, int]] = 'black',
+                    default_stroke_width: int = 0,
+                    default_stroke_fill: Union[str, Tuple[int, int, int], Tuple[int, int, int, int]] = 'black'
+                    ) -> Tuple[Tuple[TextRun, ...], ...]:
+    """
+    说明：
+        将富文本解析为按行分组的TextRun，结果不可变，相同文本及默认样式的解析结果会被缓存复用
+    参数：
+        :param text: 富文本字符串
+        :param default_font: 非特殊文本默认字体
+        :param default_size: 非特殊文本默认大小
+        :param default_color: 非特殊文本默认颜色
+        :param default_stroke_width: 非特殊文本默认轮廓宽度
+        :param default_stroke_fill: 非特殊文本默认轮廓颜色
+        :return: 行元组，每行为TextRun元组
+    """
+    args = (text, str(default_font), default_size, default_color, default_stroke_width, default_stroke_fill)
+    try:
+        return _parse_rich_text(*args)
+    except TypeError:  # 默认样式不可哈希（如列表形式的颜色）时不使用缓存
+        return _parse_rich_text.__wrapped__(*args)
+
+
+def wrap_lines(total_lines: Sequence[Sequence['TextRun']], max_width: float) -> List[List['TextRun']]:
+    """
+    说明:
+        按最大宽度对已分片的文本行自动换行，字符超出宽度时移至下一行
+        对每片文本的字符宽度求前缀和，二分查找换行位置
+        FreeType返回的宽度为1/64的整数倍，前缀和之差与逐字累加的结果完全一致
+    参数:
+        :param total_lines: 行列表，每行为TextRun列表
+        :param max_width: 最大行宽
+        :return: 换行后的行列表
+    """
+    new_total_lines = []
+    for line in total_lines:
+        new_line = []
+        line_width = 0
+        for piece in line:
+            text = piece.text
+            widths = get_advance_table(piece.fonts, piece.size).measure(text)
+            prefix = list(accumulate(widths))
+            seg_start = 0  # 当前片段在文本中的起始下标
+            base = 0  # 当前片段之前字符的宽度和
+            lo = 0
+            while True:
+                # 第一个使行宽超出最大宽度的字符
+                index = bisect_right(prefix, max_width - line_width + base, lo)
+                if index >= len(text):
+                    break
+                new_line.append(piece._replace(text=text[seg_start:index]))
+                new_total_lines.append(new_line)
+                new_line = []
+                line_width = widths[index]
+                base = prefix[index]
+                seg_start = index
+                lo = index + 1  # 新行的首个字符即使超宽也保留在该行
+            if prefix:
+                line_width += prefix[-1] - base
+            new_line.append(piece._replace(text=text[seg_start:]))
+        if line:
+            new_total_lines.append(new_line)
+    return new_total_lines
 
 
 class Box(object):
@@ -61,7 +344,6 @@ class ImageFactory(object):
         else:
             self.img = Image.open(img)
         self.mode = image_mode
-        self.img.convert(image_mode)
         self.draw = ImageDraw.Draw(self.img)
         self.boxes = {}  # 参照方框
         self.boxes.update({
@@ -85,7 +367,6 @@ class ImageFactory(object):
             self.img = img
         else:
             self.img = Image.open(img)
-        self.img.convert(self.mode)
         self.draw = ImageDraw.Draw(self.img)
         self.boxes['self'] = Box((0, 0), self.img.size)
 
@@ -303,7 +584,9 @@ class ImageFactory(object):
             if len(color) == 3 or type(color) == str:
                 self.draw.rectangle((*start_pos, *end_pos), color, outline, width)
             elif len(color) == 4:
-                self.img_paste(Image.new('RGBA', box_size, color=color), box_pos)
+                # 直接覆盖box范围内的像素（含透明度），与粘贴纯色图片结果相同，不创建临时图片
+                if box_size[0] > 0 and box_size[1] > 0:
+                    self.draw.rectangle((*start_pos, end_pos[0] - 1, end_pos[1] - 1), fill=color)
                 self.draw.rectangle((*start_pos, *end_pos), outline=outline, width=width)
         else:
             self.draw.rectangle((*start_pos, *end_pos), color, outline, width)
@@ -387,6 +670,96 @@ class ImageFactory(object):
         self.img.show()
 
 
+class TextRasterCache(object):
+    def __init__(self, max_entries: int = 512):
+        """
+        说明:
+            单行文本图片的LRU缓存，按（文本，字体，字号，颜色）保存 simple_text 的渲染结果，
+            表头、序号等重复文本只需渲染一次
+            缓存中的图片不直接交给调用方，调用方获得的是副本，修改副本不影响缓存
+        参数:
+            :param max_entries: 最多保存的文本图片数量
+        """
+        self.max_entries = max_entries
+        self._images: 'OrderedDict[tuple, Img]' = OrderedDict()
+        self.memory = 0  # 当前缓存图片占用的字节数
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Img]:
+        """
+        说明: 获取缓存的文本图片副本
+        :param key: 缓存键
+        :return: Image对象，未命中返回None
+        """
+        with self._lock:
+            pic = self._images.get(key)
+            if pic is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+        return pic.copy()
+
+    def put(self, key: tuple, pic: Img):
+        """
+        说明: 保存文本图片的副本，超出数量上限时淘汰最久未使用的图片
+        :param key: 缓存键
+        :param pic: Image对象
+        """
+        if self.max_entries <= 0:
+            return
+        pic = pic.copy()
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self.memory -= old.size[0] * old.size[1] * 4
+            self._images[key] = pic
+            self.memory += pic.size[0] * pic.size[1] * 4
+            while len(self._images) > self.max_entries:
+                _, old = self._images.popitem(last=False)
+                self.memory -= old.size[0] * old.size[1] * 4
+
+    def clear(self):
+        """
+        说明: 清空缓存
+        """
+        with self._lock:
+            self._images.clear()
+            self.memory = 0
+
+    def stats(self) -> dict:
+        """
+        说明: 缓存统计信息
+        :return: 字典（数量，内存占用，命中数，未命中数，命中率）
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._images),
+                'memory': self.memory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+text_cache = TextRasterCache()
+
+
+def _reset_locks():
+    """
+    说明: fork 时可能复制了其他线程持有的锁，在子进程中重新创建字体注册表及文本图片缓存的锁
+    """
+    font_registry._lock = threading.Lock()
+    text_cache._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):  # 仅 Unix 平台支持
+    os.register_at_fork(after_in_child=_reset_locks)
+
+
 def simple_text(text: str,
                 size: int,
                 font: str = 'SIMYOU.TTF',
@@ -394,28 +767,39 @@ def simple_text(text: str,
                 ):
     """
     说明:
+        渲染单行文本，相同参数的渲染结果从 text_cache 中获取
     :param text:
     :param size:
     :param font:
     :param color:
-    :return:
+    :return: Image对象，可以自由修改
     """
-    print(f"[DEBUG] simple_text: 渲染文本 '{text}', 字体大小 {size}")
-    using_font = ImageFont.truetype(font, size)
+    key = (text, str(font), size, color)
+    pic = text_cache.get(key)
+    if pic is None:
+        pic = _render_simple_text(text, size, font, color)
+        text_cache.put(key, pic)
+    return pic
+
+
+def _render_simple_text(text: str,
+                        size: int,
+                        font: str,
+                        color: Union[str, Tuple[int, int, int], Tuple[int, int, int, int]]) -> Img:
+    using_font = get_font(font, size)
     # 使用 getbbox 获取文本边界框
     bbox = using_font.getbbox(text)
-    print(f"[DEBUG] simple_text: bbox = {bbox}")
     # 计算实际需要的图片大小
     width = bbox[2] + 4  # 增加少量的水平空间
     height = bbox[3] + 4  # 增加少量的垂直空间
-    print(f"[DEBUG] simple_text: 图片大小 = ({width}, {height})")
     # 创建图片时留出足够的空间
     pic = Image.new('RGBA', (width, height), (0, 0, 0, 0))
     draw = ImageDraw.Draw(pic)
     # 绘制文本，考虑 bbox 的偏移
     # 在 Pillow 10+ 中，需要考虑 bbox 的偏移
     draw_pos = (2, 2)  # 绘制位置小幅偏移，确保文本不被裁剪
-    print(f"[DEBUG] simple_text: 绘制位置 = {draw_pos}")
+    if trace_text.enabled:
+        trace_text.emit('simple_text', text=text, size=size, bbox=bbox, img_size=(width, height), pos=draw_pos)
     draw.text(draw_pos, text, fill=color, font=using_font)
     return pic
 
@@ -430,15 +814,188 @@ def calculate_text_size(text: str,
     :param font:
     :return:
     """
-    using_font = ImageFont.truetype(font, size)
+    using_font = get_font(font, size)
     bbox = using_font.getbbox(text)
-    print(f"[DEBUG] calculate_text_size: 文本 '{text}', bbox = {bbox}")
     width = bbox[2] + 4  # 增加少量的水平空间
     height = bbox[3] + 4  # 增加少量的垂直空间
-    print(f"[DEBUG] calculate_text_size: 大小 = ({width}, {height})")
+    if trace_text.enabled:
+        trace_text.emit('calculate_text_size', text=text, size=size, bbox=bbox, text_size=(width, height))
     return (width, height)
 
 
+class TextLayout(object):
+    def __init__(self,
+                 text: str,
+                 spacing: int = 0,
+                 default_font: str = 'SIMYOU.TTF',
+                 default_color: Union[str, Tuple[int, int, int], Tuple[int, int, int, int]] = 'black',
+                 default_size: int = 20,
+                 default_stroke_width: int = 0,
+                 default_stroke_fill: Union[str, Tuple[int, int, int], Tuple[int, int, int, int]] = 'black',
+                 box_size: Tuple[int, int] = (0, 0),
+                 horizontal_align: Optional[Literal["left", "middle", "right"]] = "left",
+                 vertical_align: Optional[Literal["top", "middle", "bottom"]] = "bottom",
+                 h_border_ignore: bool = False,
+                 v_border_ignore: bool = False
+                 ):
+        """
+        说明：
+            富文本排版结果，构造时完成解析、换行、截断及测量，
+            size 不需要绘制即可获得，调用 render 时才绘制为透明底版图片
+            参数与 multi_text 相同
+        :param text: 富文本字符串
+        :param spacing: 行距 px
+        :param default_font: 非特殊文本默认字体
+        :param default_color: 非特殊文本默认颜色
+        :param default_size: 非特殊文本默认大小
+        :param default_stroke_width: 非特殊文本默认轮廓宽度
+        :param default_stroke_fill: 非特殊文本默认轮廓颜色
+        :param box_size: 目标转换的box大小
+        :param horizontal_align:
+        :param vertical_align:
+        :param h_border_ignore: 是否无视水平边界限制，默认为False
+        :param v_border_ignore: 是否无视垂直边界限制，默认为False
+        """
+        if box_size[0] <= 0:
+            h_border_ignore = True
+        if box_size[1] <= 0:
+            v_border_ignore = True
+        source_box = box_size
+        # 解析原始文本
+        total_lines = parse_rich_text(text, default_font, default_size, default_color,
+                                      default_stroke_width, default_stroke_fill)
+        # 是否自动换行处理
+        if not h_border_ignore and box_size[0] > 0:
+            if default_stroke_width > 0:
+                box_size = (box_size[0] - default_stroke_width * 2, box_size[1])
+            total_lines = wrap_lines(total_lines, box_size[0])
+        # 每行各片的（宽度，高度）
+        line_sizes = []
+        # 超高部分
+        self.surplus_lines: Sequence[Sequence[TextRun]] = []
+        # 是否超高舍去
+        if not v_border_ignore and box_size[1] > 0:
+            if default_stroke_width > 0:
+                box_size = (box_size[0], box_size[1] - default_stroke_width * 2)
+            total_height = 0
+            for i, line in enumerate(total_lines):
+                pieces_sizes = self.measure_line(line)
+                line_height = max([0] + [x[1] for x in pieces_sizes])
+                if total_height + line_height + spacing > box_size[1]:
+                    self.surplus_lines = total_lines[i:]
+                    total_lines = total_lines[:i]
+                    break
+                else:
+                    total_height += line_height + spacing
+                    line_sizes.append(pieces_sizes)
+        line_sizes += [self.measure_line(line) for line in total_lines[len(line_sizes):]]
+        # 整体测高
+        if box_size[0] <= 0 or box_size[1] <= 0:
+            total_height, total_width = 0, 0
+            for i, pieces_sizes in enumerate(line_sizes):
+                line_height, line_width = 0, 0
+                for piece_width, piece_height in pieces_sizes:
+                    line_width += piece_width
+                    if piece_height > line_height:
+                        line_height = piece_height
+                total_height += line_height
+                if i != len(line_sizes) - 1:
+                    total_height += spacing
+                if line_width > total_width:
+                    total_width = line_width
+            if box_size[0] <= 0:
+                box_size = (total_width, box_size[1])
+            if box_size[1] <= 0:
+                box_size = (box_size[0], total_height)
+        # 增加少量的空间以确保文本完全显示
+        padding = 4  # 添加少量的填充空间
+        true_box_size = (box_size[0] + default_stroke_width * 2 + padding * 2, box_size[1] + default_stroke_width * 2 + padding * 2)
+        if not h_border_ignore and source_box != (0, 0):
+            true_box_size = (source_box[0], box_size[1] + default_stroke_width * 2 + padding * 2)
+        if not v_border_ignore and source_box != (0, 0):
+            true_box_size = (box_size[0] + default_stroke_width * 2 + padding * 2, source_box[1])
+        self.lines = total_lines
+        self.line_sizes = line_sizes
+        self.size = true_box_size
+        self.spacing = spacing
+        self.default_stroke_width = default_stroke_width
+        self.horizontal_align = horizontal_align
+        self.vertical_align = vertical_align
+
+    @staticmethod
+    def measure_line(line: Sequence[TextRun]) -> List[Tuple[float, int]]:
+        """
+        说明: 测量一行中每片文本的宽度和高度
+        :param line: TextRun列表
+        :return: 列表[（宽度，高度）]
+        """
+        pieces_sizes = []
+        for piece in line:
+            using_font = get_font(piece.fonts, piece.size)
+            bbox = using_font.getbbox(piece.text)
+            pieces_sizes.append((using_font.getlength(piece.text), bbox[3] - bbox[1]))
+        return pieces_sizes
+
+    @property
+    def surplus(self) -> str:
+        """
+        说明: 因超高被舍去的文本，以富文本形式返回
+        """
+        lines_text = []
+        for new_line in self.surplus_lines:
+            line_texts = []
+            for piece in new_line:
+                params = [f'{key}={value}' for key, value in piece._asdict().items() if key != 'text']
+                piece_text = f'<ft {" ".join(params)}>{piece.text}</ft>'
+                line_texts.append(piece_text)
+            lines_text.append(''.join(line_texts))
+        return '\n'.join(lines_text)
+
+    def render(self) -> Img:
+        """
+        说明: 绘制排版结果
+        :return: Img对象
+        """
+        true_box_size = self.size
+        img = Image.new('RGBA', true_box_size,
+                        color=(0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        pos = (0 + self.default_stroke_width + 2, 0 + self.default_stroke_width + 2)
+        line_start_pos = list(pos)
+        # 对片进行分行，显示
+        for x, pieces_sizes in zip(self.lines, self.line_sizes):
+            height_list = [x[1] for x in pieces_sizes]
+            width_list = [x[0] for x in pieces_sizes]
+            max_height = max(height_list)
+            total_width = sum(width_list)
+            if self.horizontal_align == 'left':
+                pos = line_start_pos.copy()
+            elif self.horizontal_align == 'middle':
+                pos = [int((true_box_size[0] - total_width) / 2), line_start_pos[1]]
+            elif self.horizontal_align == 'right':
+                pos = [true_box_size[0] + line_start_pos[0] - total_width, line_start_pos[1]]
+            for index2, y in enumerate(x):
+                if self.vertical_align == 'top':
+                    pos[1] = line_start_pos[1]
+                elif self.vertical_align == 'middle':
+                    pos[1] = line_start_pos[1] + int((max_height - pieces_sizes[index2][1]) / 2)
+                elif self.vertical_align == 'bottom':
+                    pos[1] = line_start_pos[1] + max_height - pieces_sizes[index2][1]
+                using_font = get_font(y.fonts, y.size)
+                # 添加小量的内边距，确保文本不被裁剪
+                adjusted_pos = (pos[0] + 2, pos[1] + 2)
+                if trace_text.enabled:
+                    trace_text.emit('multi_text', text=y.text, size=y.size, pos=adjusted_pos)
+                draw.text(adjusted_pos, y.text,
+                          fill=y.color,
+                          font=using_font,
+                          stroke_width=y.stroke_width,
+                          stroke_fill=y.stroke_fill)
+                pos[0] += pieces_sizes[index2][0]
+            line_start_pos[1] += (max_height + self.spacing)
+        return img
+
+
 def multi_text(text: str,
                spacing: int = 0,
                default_font: str = 'SIMYOU.TTF',
@@ -480,225 +1037,13 @@ def multi_text(text: str,
     :param get_surplus: 是否获得多余的字符串
     :return: Img对象
     """
-    if box_size[0] <= 0:
-        h_border_ignore = True
-    if box_size[1] <= 0:
-        v_border_ignore = True
-    source_box = box_size
-    surplus_text = ''
-    # 分割换行符
-    enter_list = text.split('\n')
-    total_lines = []
-    # 解析原始文本
-    for line in enter_list:
-        # 根据特殊文本结束符号分片
-        raw_split_list = line.split('</ft>')
-        line_pieces = []
-        for piece in raw_split_list:
-            # 匹配<ft>中内容
-            a = re.search(r"<ft(.*)>", piece)
-            if a:
-                # 匹配结果起始及结束下标
-                start, end = a.span()
-                font = default_font
-                size = default_size
-                color = default_color
-                stroke_width = default_stroke_width
-                stroke_fill = default_stroke_fill
-                # 根据文本对参数赋值
-                for param in a.group(1).split():
-                    _param = param.split('=')
-                    if _param[0] == 'fonts':
-                        font = _param[1]
-                    elif _param[0] == 'size':
-                        size = int(_param[1])
-                    elif _param[0] == 'stroke_width':
-                        stroke_width = int(_param[1])
-                    elif _param[0] == 'color':
-                        rgba_result = re.findall(r'\d+', _param[1])
-                        if len(rgba_result) in [3, 4]:
-                            color = tuple((int(x) for x in rgba_result))
-                        else:
-                            color = _param[1]
-                    elif _param[0] == 'stroke_fill':
-                        rgba_result = re.findall(r'\d+', _param[1])
-                        if len(rgba_result) in [3, 4]:
-                            stroke_fill = tuple((int(x) for x in rgba_result))
-                        else:
-                            stroke_fill = _param[1]
-                # 特殊文本外的结果储存
-                if piece[:start]:
-                    front_piece = {'fonts': default_font,
-                                   'size': default_size,
-                                   'color': default_color,
-                                   'stroke_width': default_stroke_width,
-                                   'stroke_fill': default_stroke_fill,
-                                   'text': piece[:start]}
-                    line_pieces.append(front_piece)
-                # 特殊文本结果储存
-                multi_piece = {'fonts': font,
-                               'size': size,
-                               'color': color,
-                               'stroke_width': stroke_width,
-                               'stroke_fill': stroke_fill,
-                               'text': piece[end:]}
-                line_pieces.append(multi_piece)
-            else:
-                if piece:
-                    other_piece = {'fonts': default_font,
-                                   'size': default_size,
-                                   'color': default_color,
-                                   'stroke_width': default_stroke_width,
-                                   'stroke_fill': default_stroke_fill,
-                                   'text': piece}
-                    line_pieces.append(other_piece)
-        # 总行储存
-        total_lines.append(line_pieces)
-    # 是否自动换行处理
-    if not h_border_ignore and box_size[0] > 0:
-        if default_stroke_width > 0:
-            box_size = (box_size[0] - default_stroke_width * 2, box_size[1])
-        new_total_lines = []
-        for line in total_lines:
-            new_line = []
-            new_line_width = 0
-            new_piece_cha_list = []
-            for i, piece in enumerate(line):
-                using_font = ImageFont.truetype(piece['fonts'], piece['size'])
-                for cha in piece['text']:
-                    cha_width = using_font.getlength(cha)
-                    new_line_width += cha_width
-                    if new_line_width <= box_size[0]:
-                        new_piece_cha_list.append(cha)
-                    else:
-                        new_text = ''.join(new_piece_cha_list)
-                        new_piece = piece.copy()
-                        new_piece['text'] = new_text
-                        new_line.append(new_piece)
-                        new_total_lines.append(new_line)
-                        new_line = []
-                        new_line_width = cha_width
-                        new_piece_cha_list = [cha]
-                new_text = ''.join(new_piece_cha_list)
-                new_piece = piece.copy()
-                new_piece['text'] = new_text
-                new_line.append(new_piece)
-                new_piece_cha_list = []
-                if i == len(line) - 1:
-                    new_total_lines.append(new_line)
-        total_lines = new_total_lines
-    # 是否超高舍去
-    if not v_border_ignore and box_size[1] > 0:
-        if default_stroke_width > 0:
-            box_size = (box_size[0], box_size[1] - default_stroke_width * 2)
-        total_height = 0
-        for i, line in enumerate(total_lines):
-            line_height = 0
-            for piece in line:
-                using_font = ImageFont.truetype(piece['fonts'], piece['size'])
-                bbox = using_font.getbbox(piece['text'])
-                piece_height = bbox[3] - bbox[1]
-                if piece_height > line_height:
-                    line_height = piece_height
-            if total_height + line_height + spacing > box_size[1]:
-                if get_surplus:
-                    lines_text = []
-                    for new_line in total_lines[i:]:
-                        line_texts = []
-                        for piece in new_line:
-                            params = [f'{key}={value}' for key, value in piece.items() if key != 'text']
-                            piece_text = f'<ft {" ".join(params)}>{piece["text"]}</ft>'
-                            line_texts.append(piece_text)
-                        lines_text.append(''.join(line_texts))
-                    surplus_text = '\n'.join(lines_text)
-
-                    total_lines = total_lines[:i]
-                else:
-                    total_lines = total_lines[:i]
-                break
-            else:
-                total_height += line_height + spacing
-    # 整体测高
-    if box_size[0] <= 0 or box_size[1] <= 0:
-        total_height, total_width = 0, 0
-        for i, line in enumerate(total_lines):
-            line_height, line_width = 0, 0
-            for piece in line:
-                using_font = ImageFont.truetype(piece['fonts'], piece['size'])
-                bbox = using_font.getbbox(piece['text'])
-                piece_width = using_font.getlength(piece['text'])
-                piece_height = bbox[3] - bbox[1]
-                line_width += piece_width
-                if piece_height > line_height:
-                    line_height = piece_height
-            total_height += line_height
-            if i != len(total_lines) - 1:
-                total_height += spacing
-            if line_width > total_width:
-                total_width = line_width
-        if box_size[0] <= 0:
-            box_size = (total_width, box_size[1])
-        if box_size[1] <= 0:
-            box_size = (box_size[0], total_height)
-    # 增加少量的空间以确保文本完全显示
-    padding = 4  # 添加少量的填充空间
-    true_box_size = (box_size[0] + default_stroke_width * 2 + padding * 2, box_size[1] + default_stroke_width * 2 + padding * 2)
-    if not h_border_ignore and source_box != (0, 0):
-        true_box_size = (source_box[0], box_size[1] + default_stroke_width * 2 + padding * 2)
-    if not v_border_ignore and source_box != (0, 0):
-        true_box_size = (box_size[0] + default_stroke_width * 2 + padding * 2, source_box[1])
-    img = Image.new('RGBA', true_box_size,
-                    color=(0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    pos = (0 + default_stroke_width + 2, 0 + default_stroke_width + 2)
-    line_start_pos = list(pos)
-    # 对片进行分行，测量，显示
-    for x in total_lines:
-        pieces_sizes = []
-        for y in x:
-            using_font = ImageFont.truetype(y['fonts'], y['size'])
-            bbox = using_font.getbbox(y['text'])
-            piece_width = using_font.getlength(y['text'])
-            piece_height = bbox[3] - bbox[1]
-            pieces_sizes.append((piece_width, piece_height))
-        height_list = [x[1] for x in pieces_sizes]
-        width_list = [x[0] for x in pieces_sizes]
-        max_height = max(height_list)
-        total_width = sum(width_list)
-        if horizontal_align == 'left':
-            pos = line_start_pos.copy()
-        elif horizontal_align == 'middle':
-            pos = [int((true_box_size[0] - total_width) / 2), line_start_pos[1]]
-        elif horizontal_align == 'right':
-            pos = [true_box_size[0] + line_start_pos[0] - total_width, line_start_pos[1]]
-        for index2, y in enumerate(x):
-            if vertical_align == 'top':
-                pos[1] = line_start_pos[1]
-            elif vertical_align == 'middle':
-                pos[1] = line_start_pos[1] + int((max_height - pieces_sizes[index2][1]) / 2)
-            elif vertical_align == 'bottom':
-                pos[1] = line_start_pos[1] + max_height - pieces_sizes[index2][1]
-            using_font = ImageFont.truetype(y['fonts'], y['size'])
-            # 在 Pillow 10+ 中，需要考虑 bbox 的偏移
-            print(f"[DEBUG] multi_text: 渲染文本 '{y['text']}', 字体大小 {y['size']}")
-            print(f"[DEBUG] multi_text: 原始位置 = {pos}")
-            # 获取文本的边界框
-            bbox = using_font.getbbox(y['text'])
-            # 调整绘制位置，确保文本完全显示
-            # 添加小量的内边距，确保文本不被裁剪
-            adjusted_pos = (pos[0] + 2, pos[1] + 2)
-            print(f"[DEBUG] multi_text: 调整后位置 = {adjusted_pos}, bbox = {bbox}")
-            draw.text(adjusted_pos, y['text'],
-                      fill=y['color'],
-                      font=using_font,
-                      stroke_width=y['stroke_width'],
-                      stroke_fill=y['stroke_fill'])
-            pos[0] += pieces_sizes[index2][0]
-        line_start_pos[1] += (max_height + spacing)
+    layout = TextLayout(text, spacing, default_font, default_color, default_size, default_stroke_width,
+                        default_stroke_fill, box_size, horizontal_align, vertical_align,
+                        h_border_ignore, v_border_ignore)
     if get_surplus:
-        return img, surplus_text
+        return layout.render(), layout.surplus
     else:
-        return img
+        return layout.render()
 
 
 def arrange_img(img_list: List[Img],
@@ -764,6 +1109,9 @@ def arrange_img(img_list: List[Img],
     return imgReturn.img
 
 
+_ZERO_ALPHA_LUT = [255] + [0] * 255  # 透明度为0的像素映射为255，其余为0
+
+
 def alpha2white(img: Img) -> Img:
     """
     说明：
@@ -772,17 +1120,29 @@ def alpha2white(img: Img) -> Img:
         :param img: Image对象
     """
     img = img.convert("RGBA")
-    width, height = img.size
-    for yh in range(height):
-        for xw in range(width):
-            dot = (xw, yh)
-            color_d = img.getpixel(dot)
-            if color_d[3] == 0:
-                color_d = (255, 255, 255, 255)
-                img.putpixel(dot, color_d)
+    # 以完全透明的像素为蒙版，整体填充白色，半透明像素保持不变
+    mask = img.getchannel('A').point(_ZERO_ALPHA_LUT)
+    img.paste((255, 255, 255, 255), mask=mask)
     return img
 
 
+def flatten_alpha(img: Img,
+                  color: Tuple[int, int, int] = (255, 255, 255)) -> Img:
+    """
+    说明：
+        将带透明通道的图片按透明度合成到纯色底版上，得到不透明的RGB图片
+        与 alpha2white 不同，半透明像素会与底色混合
+    参数：
+        :param img: Image对象
+        :param color: 底版颜色
+        :return: RGB模式的Image对象
+    """
+    if img.mode not in ('RGBA', 'LA', 'P', 'PA'):
+        return img.convert('RGB')
+    img = img.convert('RGBA')
+    return Image.alpha_composite(Image.new('RGBA', img.size, (*color, 255)), img).convert('RGB')
+
+
 def rgb2greyscale(img: Img) -> Img:
     """
     说明:
@@ -842,10 +1202,138 @@ def img2b64(pic: Image) -> str:
     """
     buf = BytesIO()
     pic.save(buf, format="PNG")
-    base64_str = base64.b64encode(buf.getvalue()).decode()
+    # 直接编码缓冲区内容，避免 getvalue() 复制
+    base64_str = base64.b64encode(buf.getbuffer()).decode('ascii')
     return base64_str
 
 
+def img2bytes(pic: Image) -> bytes:
+    """
+    说明：
+        PIL图片转PNG数据
+    参数：
+        :param pic: 通过PIL打开的图片文件
+        :return PNG数据
+    """
+    buf = BytesIO()
+    pic.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def bytes2b64(data: bytes) -> str:
+    """
+    说明：
+        图片数据转base64
+    参数：
+        :param data: 编码后的图片数据
+        :return base64字符串
+    """
+    return base64.b64encode(data).decode('ascii')
+
+
+def image_suffix(data: bytes) -> str:
+    """
+    说明：
+        根据文件头判断编码后图片数据的扩展名
+    参数：
+        :param data: 编码后的图片数据
+        :return 扩展名
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    if data[:2] == b'\xff\xd8':
+        return '.jpg'
+    return '.png'
+
+
+class ImageEncoder(object):
+    formats = ('png', 'png8', 'webp', 'jpeg')
+
+    def __init__(self,
+                 fmt: Literal['png', 'png8', 'webp', 'jpeg'] = 'png',
+                 compress_level: int = 6,
+                 quality: int = 85,
+                 max_bytes: int = 0):
+        """
+        说明:
+            菜单图片编码器
+            png: 完整RGBA的PNG
+            png8: 调色板量化后的PNG，菜单颜色较少，体积远小于完整PNG
+            webp: 无损WebP
+            jpeg: 去除透明通道后的JPEG
+        参数:
+            :param fmt: 输出格式
+            :param compress_level: 压缩等级，PNG为0-9，WebP为0-6
+            :param quality: JPEG质量
+            :param max_bytes: 输出大小预算（字节），超出时依次尝试更小的编码方式，为0时不限制
+        """
+        if fmt not in self.formats:
+            raise ValueError(f'Image format must be one of {self.formats}')
+        if fmt == 'webp' and not features.check('webp'):  # Pillow 未编译 WebP 支持
+            fmt = 'png'
+        self.fmt = fmt
+        self.compress_level = compress_level
+        self.quality = quality
+        self.max_bytes = max_bytes
+
+    def options(self) -> tuple:
+        """
+        说明: 编码参数，用于区分不同编码参数生成的缓存
+        """
+        return self.fmt, self.compress_level, self.quality, self.max_bytes
+
+    def candidates(self) -> List[Tuple[str, int, int]]:
+        """
+        说明: 按优先级排列的编码方式，第一个为配置的编码方式，其余体积依次减小
+        :return: 列表[(格式，压缩等级，质量)]
+        """
+        result = [(self.fmt, self.compress_level, self.quality)]
+        if self.max_bytes > 0:
+            fallback = [('png8', 9, self.quality)]
+            if features.check('webp'):
+                fallback.append(('webp', 6, self.quality))
+            fallback += [('jpeg', 0, quality) for quality in (85, 70, 50) if quality <= self.quality]
+            result += [x for x in fallback if x not in result]
+        return result
+
+    @staticmethod
+    def encode_with(pic: Img, fmt: str, compress_level: int, quality: int) -> bytes:
+        """
+        说明: 使用指定参数编码图片
+        :param pic: Image对象
+        :param fmt: 格式
+        :param compress_level: 压缩等级
+        :param quality: JPEG质量
+        :return: 编码后的图片数据
+        """
+        buf = BytesIO()
+        if fmt == 'png':
+            pic.save(buf, format='PNG', compress_level=compress_level)
+        elif fmt == 'png8':
+            pic.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, format='PNG', compress_level=compress_level)
+        elif fmt == 'webp':
+            pic.save(buf, format='WEBP', lossless=True, method=min(compress_level, 6))
+        else:
+            # JPEG 不支持透明通道，合成到白色底版上
+            flatten_alpha(pic).save(buf, format='JPEG', quality=quality)
+        return buf.getvalue()
+
+    def encode(self, pic: Img) -> Tuple[bytes, str]:
+        """
+        说明: 编码图片，设置了大小预算时返回第一个满足预算的结果，均不满足时返回体积最小的结果
+        :param pic: Image对象
+        :return: 元组（编码后的图片数据，实际使用的格式）
+        """
+        best = None
+        for fmt, compress_level, quality in self.candidates():
+            data = self.encode_with(pic, fmt, compress_level, quality)
+            if self.max_bytes <= 0 or len(data) <= self.max_bytes:
+                return data, fmt
+            if best is None or len(data) < len(best[0]):
+                best = (data, fmt)
+        return best
+
+
 def pic2b64(path: Union[str, Path]) -> str:
     """
         说明：
@@ -1,18 +1,45 @@
+import gc
+import os
+import re
 import json
+import time
+import pickle
+import tempfile
+import asyncio
+import threading
+import hashlib
 import importlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, List, Tuple
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, Dict, Mapping, Optional, Sequence, Set, Union, List, Tuple
 
 import nonebot.plugin
 from nonebot import logger
 from nonebot.plugin import PluginMetadata
 
-from PIL import Image
-from fuzzywuzzy import process, fuzz
 from pydantic import error_wrappers
 
-from .data_struct import PluginMenuData
-from .template import DefaultTemplate, PicTemplate
+from .backend import MenuTask, ProcessRenderPool, page_count, render_task
+from .cache import CacheEntry, DiskCache, QueryCache, RenderCache
+from .config import Config
+from .data_struct import FuncData, PluginMenuData
+from .search import FuzzyIndex
+from .trace import configure_tracing, get_tracer
+
+if TYPE_CHECKING:
+    from PIL.Image import Image as Img
+    from .img_tool import ImageEncoder
+    from .template import PicTemplate
+
+DISK_CACHE_VERSION = 1  # 渲染结果变化时递增，使旧的磁盘缓存失效
+LOAD_WORKERS = 8  # 加载插件信息时读取json文件的最大线程数
+SNAPSHOT_VERSION = 2  # 菜单数据结构或索引结构变化时递增，使旧的快照失效
+SNAPSHOT_FILE = 'menu_snapshot.pickle'  # menu_config/cache 中的菜单数据快照文件名
+PAGE_PATTERN = re.compile(r'[pP](\d+)')  # 一级菜单翻页，如 菜单 p2
+# 默认模板及绘图代码所在文件，插件升级后磁盘缓存随之失效
+RENDER_SOURCES = (Path(__file__).parent / 'template.py', Path(__file__).parent / 'img_tool.py')
+trace_data = get_tracer('data')
 
 
 def fuzzy_match_and_check(item: str, match_list: List[str]) -> Union[None, str]:
@@ -24,125 +51,518 @@ def fuzzy_match_and_check(item: str, match_list: List[str]) -> Union[None, str]:
     """
     if item in match_list:  # 在列表中直接返回结果
         return item
-    else:
-        vague_result = [x[0] for x in process.extract(item, match_list, scorer=fuzz.partial_ratio, limit=10)]
-        vague_result = [x[0] for x in process.extract(item, vague_result, scorer=fuzz.WRatio, limit=10)]
-        result = list(process.extract(item, vague_result, scorer=fuzz.ratio, limit=1))[0]
-        if result[1] < 45:  # 置信度过小返回空值
-            return None
-        else:
-            return result[0]
+    # 临时建立索引，需要反复查询同一列表时应保存 FuzzyIndex 对象
+    return FuzzyIndex(match_list).match(item)
+
+
+class PluginIndex(object):
+    __slots__ = ('data_version', 'plugins', 'visible_positions', 'visible', 'main_menu_data', 'names', 'func_names',
+                 'plugin_search', 'func_search', '_positions')
+
+    def __init__(self, plugins: Sequence[PluginMenuData] = (), data_version: int = 0):
+        """
+        说明:
+            一次加载的插件信息的只读索引，加载完成时建立一次，重新加载时整体替换
+            查询插件及功能时不再遍历插件列表，取得同一个索引对象即可保证数据版本一致
+        参数:
+            :param plugins: 排序后的插件列表
+            :param data_version: 数据版本号
+        """
+        self.data_version = data_version
+        self.plugins: Tuple[PluginMenuData, ...] = tuple(plugins)
+        # 可见插件在 plugins 中的位置，按一级菜单序号排列
+        self.visible_positions: Tuple[int, ...] = tuple(i for i, x in enumerate(self.plugins) if x.visible)
+        self.visible: Tuple[PluginMenuData, ...] = tuple(self.plugins[i] for i in self.visible_positions)
+        self.main_menu_data: Tuple[Tuple[str, ...], Tuple[str, ...]] = (
+            tuple(x.name for x in self.visible),
+            tuple(x.description for x in self.visible)
+        )
+        names = {}
+        for position in self.visible_positions:  # 重名时取第一个
+            names.setdefault(self.plugins[position].name, position)
+        self.names: Mapping[str, int] = MappingProxyType(names)  # 可见插件名 -> 位置
+        func_names = []
+        for plugin in self.plugins:
+            funcs = {}
+            for i, func in enumerate(plugin.funcs or ()):
+                funcs.setdefault(func.func, i)
+            func_names.append(MappingProxyType(funcs))
+        self.func_names: Tuple[Mapping[str, int], ...] = tuple(func_names)  # 每个插件的 功能名 -> 位置
+        # 模糊搜索索引，查询时只对少量候选名称评分
+        self.plugin_search = FuzzyIndex(self.main_menu_data[0])
+        self.func_search = tuple(FuzzyIndex(func.func for func in plugin.funcs or ()) for plugin in self.plugins)
+        self._positions: Mapping[int, int] = MappingProxyType({id(x): i for i, x in enumerate(self.plugins)})
+
+    def __getstate__(self) -> dict:
+        # MappingProxyType 无法序列化，保存为普通字典；_positions 按对象id建立，加载后重新生成
+        state = {x: getattr(self, x) for x in self.__slots__ if x != '_positions'}
+        state['names'] = dict(self.names)
+        state['func_names'] = tuple(dict(x) for x in self.func_names)
+        return state
+
+    def __setstate__(self, state: dict):
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.names = MappingProxyType(self.names)
+        self.func_names = tuple(MappingProxyType(x) for x in self.func_names)
+        self._positions = MappingProxyType({id(x): i for i, x in enumerate(self.plugins)})
+
+    def position(self, plugin_data: PluginMenuData) -> Optional[int]:
+        """
+        说明: 获取插件数据在 plugins 中的位置
+        :param plugin_data: 插件数据
+        :return: 位置，不属于该索引时返回None
+        """
+        position = self._positions.get(id(plugin_data))
+        return position if position is not None and self.plugins[position] is plugin_data else None
+
+    def find_plugin(self, plugin_name: str) -> Union[int, str]:
+        """
+        说明: 按一级菜单序号、插件名或模糊匹配查找可见插件
+        :param plugin_name: 插件名/序号
+        :return: 插件在 plugins 中的位置，失败时返回异常字符串
+        """
+        if plugin_name.isdigit():  # 判断是否为下标，是则进行下标索引，否则进行模糊匹配
+            index = int(plugin_name) - 1
+            if 0 <= index < len(self.visible_positions):
+                return self.visible_positions[index]
+            return 'PluginIndexOutRange'
+        position = self.names.get(plugin_name)
+        if position is not None:
+            return position
+        result = self.plugin_search.search(plugin_name)
+        return 'CannotMatchPlugin' if result is None else self.visible_positions[result]
+
+    def find_func(self, position: int, func: str) -> Union[int, str]:
+        """
+        说明: 按序号、功能名或模糊匹配查找插件的功能
+        :param position: 插件在 plugins 中的位置
+        :param func: 功能名/序号
+        :return: 功能在插件功能列表中的位置，失败时返回异常字符串
+        """
+        funcs = self.plugins[position].funcs
+        if funcs is None:
+            return 'PluginNoFuncData'
+        if func.isdigit():
+            index = int(func) - 1
+            return index if 0 <= index < len(funcs) else 'CommandIndexOutRange'
+        func_index = self.func_names[position].get(func)
+        if func_index is not None:
+            return func_index
+        result = self.func_search[position].search(func)
+        return 'CannotMatchCommand' if result is None else result
 
 
 class DataManager(object):
     def __init__(self):
         self.plugin_menu_data_list: List[PluginMenuData] = []  # 存放menu数据的列表
         self.plugin_names: List[str] = []  # 有menu_data的插件名列表
+        self.data_version = 0  # 数据版本号，每次加载插件信息后递增
+        self.index = PluginIndex()  # 当前插件信息的只读索引
+        self.query_cache = QueryCache()  # 原始查询 -> 解析结果
+        self.load_timings: Dict[str, float] = {}  # 上次加载各阶段的耗时（秒）
+        self.loaded_plugins: Dict[str, Any] = {}  # 插件名 -> 上次加载时的插件
+        self.plugin_sources: Dict[str, PluginMenuData] = {}  # 插件名 -> 菜单数据
+        self.json_signatures: Dict[str, Tuple[int, int]] = {}  # 插件名 -> json文件的（修改时间，大小）
+        self.snapshot_path: Optional[Path] = None  # 菜单数据快照文件，为空时不使用快照
 
     def load_plugin_info(self):
-        # 清空插件列表，防止重复加载
-        self.plugin_menu_data_list = []
-        self.plugin_names = []
+        """
+        说明:
+            加载全部插件的菜单数据，menu_config/menus 中有与插件同名的json文件时优先使用json
+            分为扫描、读取（线程池并行读取json文件）、解析、校验、排序五个阶段，各阶段耗时保存在 load_timings 中
+            设置了 snapshot_path 时，扫描后计算快照指纹，与快照文件一致时直接使用快照中校验、排序后的数据及索引，
+            跳过读取、解析与校验；否则完整加载后重新写入快照
+        """
+        timings = {}
+        clock = time.perf_counter()
 
-        def load_from_dict(_meta_data: PluginMetadata):
-            # 检查是否有 visible 字段
-            visible = _meta_data.extra.get('menu_visible', True) if hasattr(_meta_data, 'extra') else True
+        def record(phase: str):
+            nonlocal clock
+            now = time.perf_counter()
+            timings[phase] = now - clock
+            clock = now
 
-            plugin_data = PluginMenuData(
-                name=_meta_data.name,
-                description=_meta_data.description,
-                usage=_meta_data.usage,
-                funcs=_meta_data.extra['menu_data'] if 'menu_data' in _meta_data.extra else None,
-                template=_meta_data.extra['menu_template'] if 'menu_template' in _meta_data.extra else 'default',
-                visible=visible  # 设置可见性
+        # 扫描：menus 目录只列出一次，不再逐个插件检查json文件是否存在
+        json_files = self.scan_json_files()
+        loaded_plugins = {plugin.name: plugin for plugin in nonebot.plugin.get_loaded_plugins()}
+        sources = []  # (插件, json文件路径)，没有json文件时从 metadata 加载
+        for plugin in loaded_plugins.values():
+            json_path = json_files.get(plugin.name)
+            if json_path is not None or plugin.metadata is not None:
+                sources.append((plugin, json_path))
+        fingerprint = None
+        if self.snapshot_path is not None:
+            fingerprint = self.snapshot_fingerprint(loaded_plugins, {
+                name: self.stat_signature(json_path) for name, json_path in json_files.items()
+                if name in loaded_plugins})
+        record('scan')
+
+        # 快照：插件集合、json文件及 metadata 均未变化
+        if fingerprint is not None and self.load_snapshot(fingerprint, loaded_plugins):
+            record('snapshot')
+            self.load_timings = timings
+            logger.opt(colors=True).info(
+                f'菜单数据从快照加载完成，共 <y>{len(self.plugin_menu_data_list)}</y> 个插件，'
+                f'耗时 <y>{sum(timings.values()) * 1000:.1f}ms</y> '
+                f'(扫描 {timings["scan"] * 1000:.1f}ms, 读取快照 {timings["snapshot"] * 1000:.1f}ms)'
             )
+            return
 
-            print(f"[DEBUG] 加载插件 {_meta_data.name} 的菜单数据, 可见性: {visible}")
-
-            self.plugin_menu_data_list.append(plugin_data)
-            # 将插件名添加到插件名列表中
-            self.plugin_names.append(plugin_data.name)
-
-        def load_from_json(_json_path: Path):
-            menu_data_dict = json.loads(_json_path.read_text(encoding='utf-8'))
-            menu_data = PluginMenuData(**menu_data_dict)
-            self.plugin_menu_data_list.append(menu_data)
-            # 将插件名添加到插件名列表中
-            self.plugin_names.append(menu_data.name)
-
-        print(f"[DEBUG] 开始加载插件信息")
-        loaded_plugins = list(nonebot.plugin.get_loaded_plugins())
-        print(f"[DEBUG] 已加载的插件数量: {len(loaded_plugins)}")
-        for i, plugin in enumerate(loaded_plugins):
-            print(f"[DEBUG] 处理插件 {i+1}/{len(loaded_plugins)}: {plugin.name}")
-            json_path = Path(Path.cwd() / 'menu_config' / 'menus' / f'{plugin.name}.json')
-            print(f"[DEBUG] 检查 JSON 路径: {json_path}, 存在: {json_path.exists()}")
-            if json_path.exists():
-                try:
-                    load_from_json(json_path)
-                    print(f"[SUCCESS] {plugin.name} 菜单数据已加载 (from json)")
-                    logger.opt(colors=True).success(f'<y>{plugin.name}</y> 菜单数据已加载 <c>(from json)</c>')
-                except json.JSONDecodeError as e:
-                    print(f"[ERROR] {plugin.name} 菜单数据加载失败 (from json): json解析失败: {e}")
-                    logger.opt(colors=True).error(f'<y>{plugin.name}</y> 菜单数据加载失败 <c>(from json)</c>\n'
-                                                  f'<y>json解析失败</y>: {e}')
-                except error_wrappers.ValidationError as e:
-                    print(f"[ERROR] {plugin.name} 菜单数据加载失败 (from json): json缺少必要键值对: {e}")
-                    logger.opt(colors=True).error(f'<y>{plugin.name}</y> 菜单数据加载失败 <c>(from json)</c>\n'
-                                                  f'<y>json缺少必要键值对</y>: \n'
-                                                  f'{e}')
+        # 读取：文件读取不占用GIL，在线程池中并行读取
+        json_sources = [x for x in sources if x[1] is not None]
+        texts: List[Tuple[Optional[Tuple[int, int]], Union[str, OSError]]] = []
+        if json_sources:
+            with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(json_sources)),
+                                    thread_name_prefix='PicMenuLoad') as executor:
+                texts = list(executor.map(self.read_json_file, (x[1] for x in json_sources)))
+        record('read')
+
+        # 解析
+        raw_data = {}  # 插件名 -> json数据
+        json_signatures = {}  # 插件名 -> json文件的（修改时间，大小）
+        for (plugin, _), (signature, text) in zip(json_sources, texts):
+            if signature is not None:
+                json_signatures[plugin.name] = signature
+            data = self.parse_json_text(plugin.name, text)
+            if data is not None:
+                raw_data[plugin.name] = data
+        record('parse')
+
+        # 校验：在新列表中加载，完成后整体替换，防止渲染线程读到加载了一半的数据
+        plugin_sources = {}  # 插件名 -> 菜单数据
+        for plugin, json_path in sources:
+            if json_path is None:
+                plugin_data = self.validate_metadata(plugin.name, plugin.metadata)
+            elif plugin.name in raw_data:  # 读取或解析失败时跳过
+                plugin_data = self.validate_json_data(plugin.name, raw_data[plugin.name])
             else:
-                meta_data = plugin.metadata
-                print(f"[DEBUG] 插件 {plugin.name} 的 metadata: {meta_data}")
-                if meta_data is None:
-                    print(f"[DEBUG] 插件 {plugin.name} 没有 metadata, 跳过")
-                    continue
-                else:
-                    try:
-                        print(f"[DEBUG] 尝试从代码加载 {plugin.name} 的菜单数据")
-                        print(f"[DEBUG] metadata: name={meta_data.name}, description={meta_data.description}, usage={meta_data.usage}")
-                        if hasattr(meta_data, 'extra'):
-                            print(f"[DEBUG] extra 存在: {meta_data.extra}")
-                            if 'menu_data' in meta_data.extra:
-                                print(f"[DEBUG] menu_data 存在: {meta_data.extra['menu_data']}")
-                        load_from_dict(meta_data)
-                        print(f"[SUCCESS] {plugin.name} 菜单数据已加载 (from code)")
-                        logger.opt(colors=True).success(f'<y>{plugin.name}</y> 菜单数据已加载 <c>(from code)</c>')
-                    except error_wrappers.ValidationError as e:
-                        print(f"[ERROR] {plugin.name} 菜单数据加载失败 (from code): __plugin_meta__.extra['menu_data'] 缺少必要键值对: {e}")
-                        logger.opt(colors=True).error(f'<y>{plugin.name}</y> 菜单数据加载失败 <c>(from code)</c>\n'
-                                                      f'<y>__plugin_meta__.extra["menu_data"] 缺少必要键值对</y>: \n'
-                                                      f'{e}')
-        print(f"[DEBUG] 插件信息加载完成, 共加载 {len(self.plugin_menu_data_list)} 个插件的菜单数据")
+                plugin_data = None
+            if plugin_data is not None:
+                plugin_sources[plugin.name] = plugin_data
+        record('validate')
+
         # 排序插件列表
-        self.plugin_menu_data_list.sort(key=lambda x: x.name.encode('gbk'))
+        plugin_menu_data_list = self.sorted_plugins(loaded_plugins, plugin_sources)
+        record('sort')
+        self.loaded_plugins = loaded_plugins
+        self.plugin_sources = plugin_sources
+        self.json_signatures = json_signatures
+        index = self.publish(plugin_menu_data_list)
+        record('index')
+        if self.snapshot_path is not None:
+            # 指纹使用读取时的文件状态，读取期间被修改的文件在下次启动时重新加载
+            self.save_snapshot(self.snapshot_fingerprint(loaded_plugins, {
+                plugin.name: json_signatures.get(plugin.name) for plugin, _ in json_sources}),
+                index, [plugin.name for plugin, _ in sources if plugin.name not in plugin_sources])
+            record('snapshot')
+        self.load_timings = timings
+        snapshot_note = f', 写入快照 {timings["snapshot"] * 1000:.1f}ms' if 'snapshot' in timings else ''
+        logger.opt(colors=True).info(
+            f'菜单数据加载完成，共 <y>{len(plugin_menu_data_list)}</y> 个插件，'
+            f'耗时 <y>{sum(timings.values()) * 1000:.1f}ms</y> '
+            f'(扫描 {timings["scan"] * 1000:.1f}ms, 读取 {timings["read"] * 1000:.1f}ms, '
+            f'解析 {timings["parse"] * 1000:.1f}ms, 校验 {timings["validate"] * 1000:.1f}ms, '
+            f'排序 {timings["sort"] * 1000:.1f}ms, 建立索引 {timings["index"] * 1000:.1f}ms'
+            f'{snapshot_note})'
+        )
+
+    def reload_changed(self) -> Optional[Tuple[PluginIndex, PluginIndex, Set[str]]]:
+        """
+        说明:
+            根据修改时间和大小检查 menu_config/menus 中的json文件，只重新加载发生变化的文件对应的插件，
+            其余插件沿用原有的菜单数据对象
+            json文件被删除时改为从插件的 metadata 加载，读取或解析失败时保留原数据
+        :return: 元组（旧索引，新索引，内容发生变化的插件名），没有插件的菜单数据发生变化时返回None
+        """
+        if not self.loaded_plugins:  # 尚未加载插件信息
+            return None
+        signatures = {}  # 插件名 -> (json文件路径, (修改时间，大小))
+        for name, json_path in self.scan_json_files().items():
+            if name in self.loaded_plugins:
+                signature = self.stat_signature(json_path)
+                if signature is not None:
+                    signatures[name] = (json_path, signature)
+        changed = [name for name in self.loaded_plugins
+                   if (signatures[name][1] if name in signatures else None) != self.json_signatures.get(name)]
+        if not changed:
+            return None
+        plugin_sources = dict(self.plugin_sources)
+        changed_names = set()
+        for name in changed:
+            if name in signatures:
+                json_path, self.json_signatures[name] = signatures[name]
+                data = self.parse_json_text(name, self.read_json_file(json_path)[1])
+                plugin_data = None if data is None else self.validate_json_data(name, data)
+                if plugin_data is None:  # 保留原数据，等待下一次修改
+                    continue
+            else:  # json文件被删除
+                self.json_signatures.pop(name, None)
+                metadata = self.loaded_plugins[name].metadata
+                plugin_data = None if metadata is None else self.validate_metadata(name, metadata)
+            old_data = plugin_sources.get(name)
+            if plugin_data == old_data:  # 只修改了文件时间或格式
+                continue
+            if plugin_data is None:
+                del plugin_sources[name]
+            else:
+                plugin_sources[name] = plugin_data
+            changed_names.update(x.name for x in (old_data, plugin_data) if x is not None)
+        if not changed_names:
+            return None
+        old_index = self.index
+        self.plugin_sources = plugin_sources
+        index = self.publish(self.sorted_plugins(self.loaded_plugins, plugin_sources))
+        return old_index, index, changed_names
+
+    def publish(self, plugin_menu_data_list: List[PluginMenuData], index: Optional[PluginIndex] = None
+                ) -> PluginIndex:
+        """
+        说明: 为新的插件列表建立索引并整体替换，数据版本号递增
+        :param plugin_menu_data_list: 排序后的插件列表
+        :param index: 已建立的索引（从快照加载），为空时重新建立
+        :return: 新的索引
+        """
+        if index is None:
+            index = PluginIndex(plugin_menu_data_list, self.data_version + 1)
+        else:
+            index.data_version = self.data_version + 1
+        self.plugin_menu_data_list = plugin_menu_data_list
         # 重新生成插件名列表，确保顺序一致
         self.plugin_names = [menu_data.name for menu_data in self.plugin_menu_data_list]
-        print(f"[DEBUG] 排序后的插件名列表: {self.plugin_names}")
+        self.data_version = index.data_version
+        self.index = index
+        self.query_cache.reset(index.data_version)
+        return index
 
-    def get_main_menu_data(self) -> Tuple[List, List]:
+    def load_snapshot(self, fingerprint: str, loaded_plugins: Dict[str, Any]) -> bool:
         """
-        获取生成主菜单的信息
-        :return: 元组（列表[插件名]，列表[插件描述]）
+        说明: 读取菜单数据快照，指纹一致时直接使用其中的菜单数据及索引，不再校验
+        :param fingerprint: 当前的快照指纹
+        :param loaded_plugins: 插件名 -> 插件
+        :return: 是否已从快照加载
         """
-        print(f"[DEBUG] 获取主菜单数据，插件数量: {len(self.plugin_menu_data_list)}")
-        print(f"[DEBUG] 插件名列表: {self.plugin_names}")
+        gc_enabled = gc.isenabled()
+        try:
+            with self.snapshot_path.open('rb') as fp:
+                gc.disable()  # 反序列化时创建大量容器对象，暂停分代回收避免反复扫描
+                snapshot = pickle.load(fp)
+        except FileNotFoundError:
+            return False
+        except Exception as e:  # 快照损坏或与当前代码不兼容时重新加载
+            logger.warning(f'菜单数据快照读取失败，重新加载: {e!r}')
+            return False
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if not isinstance(snapshot, dict) or snapshot.get('fingerprint') != fingerprint:
+            return False
+        index: PluginIndex = snapshot['index']
+        self.loaded_plugins = loaded_plugins
+        self.plugin_sources = snapshot['plugin_sources']
+        self.json_signatures = snapshot['json_signatures']
+        self.publish(list(index.plugins), index)
+        for name in snapshot['failed']:  # 文件未变化，加载失败的原因与上次相同
+            logger.opt(colors=True).warning(f'<y>{name}</y> 菜单数据加载失败，修改后重新加载 <c>(from snapshot)</c>')
+        return True
 
-        # 过滤出 visible 为 True 的插件
-        visible_plugins = [plugin for plugin in self.plugin_menu_data_list if plugin.visible]
-        print(f"[DEBUG] 可见插件数量: {len(visible_plugins)}")
+    def save_snapshot(self, fingerprint: str, index: PluginIndex, failed: List[str]):
+        """
+        说明: 原子写入菜单数据快照，写入失败不影响菜单使用
+        :param fingerprint: 快照指纹
+        :param index: 当前的索引
+        :param failed: 加载失败的插件名
+        """
+        snapshot = {
+            'fingerprint': fingerprint,
+            'index': index,
+            'plugin_sources': self.plugin_sources,
+            'json_signatures': self.json_signatures,
+            'failed': failed
+        }
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_path.parent, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    pickle.dump(snapshot, fp, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.snapshot_path)
+            except (OSError, pickle.PicklingError):
+                os.unlink(tmp_path)
+                raise
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f'菜单数据快照写入失败: {e!r}')
 
-        for i, plugin in enumerate(visible_plugins):
-            print(f"[DEBUG] 可见插件 {i+1}: {plugin.name}, 描述: {plugin.description}, 可见性: {plugin.visible}")
+    @staticmethod
+    def snapshot_fingerprint(loaded_plugins: Dict[str, Any], json_signatures: Dict[str, Optional[Tuple[int, int]]]
+                             ) -> str:
+        """
+        说明: 计算菜单数据快照的指纹，包括快照版本、插件集合及加载顺序、json文件的（修改时间，大小）及 metadata 中的菜单数据
+        :param loaded_plugins: 插件名 -> 插件
+        :param json_signatures: 插件名 -> json文件的（修改时间，大小），只包含有json文件的插件
+        :return: sha256字符串
+        """
+        parts: List[Any] = [SNAPSHOT_VERSION]
+        for name, plugin in loaded_plugins.items():
+            if name in json_signatures:
+                parts.append((name, 'json', json_signatures[name]))
+            elif plugin.metadata is not None:
+                meta_data = plugin.metadata
+                # 只包含生成菜单数据用到的字段，无法稳定表示的对象会使指纹每次不同，此时不使用快照
+                parts.append((name, 'code', meta_data.name, meta_data.description, meta_data.usage,
+                              meta_data.extra.get('menu_data'), meta_data.extra.get('menu_template'),
+                              meta_data.extra.get('menu_visible', True)))
+            else:
+                parts.append((name,))
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def sorted_plugins(loaded_plugins: Dict[str, Any], plugin_sources: Dict[str, PluginMenuData]
+                       ) -> List[PluginMenuData]:
+        """
+        说明: 按插件加载顺序取出菜单数据并按插件名排序
+        :param loaded_plugins: 插件名 -> 插件
+        :param plugin_sources: 插件名 -> 菜单数据
+        :return: 排序后的插件列表
+        """
+        plugin_menu_data_list = [plugin_sources[name] for name in loaded_plugins if name in plugin_sources]
+        plugin_menu_data_list.sort(key=lambda x: x.name.encode('gbk'))
+        return plugin_menu_data_list
 
-        # 只返回可见插件的名称和描述
-        visible_names = [plugin.name for plugin in visible_plugins]
-        visible_descriptions = [plugin.description for plugin in visible_plugins]
+    @staticmethod
+    def scan_json_files() -> Dict[str, Path]:
+        """
+        说明: 列出 menu_config/menus 中的json文件
+        :return: 字典（插件名 -> 文件路径）
+        """
+        menus_path = Path.cwd() / 'menu_config' / 'menus'
+        try:
+            return {x.name[:-5]: x for x in menus_path.iterdir() if x.name.endswith('.json')}
+        except OSError:
+            return {}
 
-        print(f"[DEBUG] 可见插件名列表: {visible_names}")
-        print(f"[DEBUG] 可见插件描述列表: {visible_descriptions}")
+    @staticmethod
+    def stat_signature(json_path: Path) -> Optional[Tuple[int, int]]:
+        """
+        说明: 获取文件的（修改时间，大小）
+        :param json_path: 文件路径
+        :return: 元组（修改时间，大小），失败时返回None
+        """
+        try:
+            stat = json_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
-        return visible_names, visible_descriptions
+    @staticmethod
+    def read_json_file(json_path: Path) -> Tuple[Optional[Tuple[int, int]], Union[str, OSError]]:
+        """
+        说明: 读取json文件，在读取线程中调用
+        :param json_path: 文件路径
+        :return: 元组（读取前文件的（修改时间，大小），文件内容），读取失败时文件内容为异常对象
+        """
+        signature = None
+        try:
+            stat = json_path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            return signature, json_path.read_text(encoding='utf-8')
+        except OSError as e:
+            return signature, e
+
+    @staticmethod
+    def parse_json_text(plugin_name: str, text: Union[str, OSError]) -> Any:
+        """
+        说明: 解析json文件内容，失败时输出错误信息
+        :param plugin_name: 插件名
+        :param text: 文件内容或读取时的异常对象
+        :return: json数据，失败时返回None
+        """
+        if isinstance(text, OSError):
+            logger.opt(colors=True).error(f'<y>{plugin_name}</y> 菜单数据加载失败 <c>(from json)</c>\n'
+                                          f'<y>文件读取失败</y>: {text}')
+            return None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.opt(colors=True).error(f'<y>{plugin_name}</y> 菜单数据加载失败 <c>(from json)</c>\n'
+                                          f'<y>json解析失败</y>: {e}')
+            return None
+
+    @staticmethod
+    def validate_json_data(plugin_name: str, data: Any) -> Optional[PluginMenuData]:
+        """
+        说明: 校验json数据，生成菜单数据
+        :param plugin_name: 插件名
+        :param data: json数据
+        :return: PluginMenuData对象，校验失败时返回None
+        """
+        try:
+            plugin_data = PluginMenuData(**data)
+        except error_wrappers.ValidationError as e:
+            logger.opt(colors=True).error(f'<y>{plugin_name}</y> 菜单数据加载失败 <c>(from json)</c>\n'
+                                          f'<y>json缺少必要键值对</y>: \n'
+                                          f'{e}')
+            return None
+        logger.opt(colors=True).success(f'<y>{plugin_name}</y> 菜单数据已加载 <c>(from json)</c>')
+        return plugin_data
+
+    @staticmethod
+    def validate_metadata(plugin_name: str, meta_data: PluginMetadata) -> Optional[PluginMenuData]:
+        """
+        说明: 根据插件的 metadata 生成菜单数据
+        :param plugin_name: 插件名
+        :param meta_data: 插件的 PluginMetadata
+        :return: PluginMenuData对象，校验失败时返回None
+        """
+        try:
+            plugin_data = PluginMenuData(
+                name=meta_data.name,
+                description=meta_data.description,
+                usage=meta_data.usage,
+                funcs=meta_data.extra['menu_data'] if 'menu_data' in meta_data.extra else None,
+                template=meta_data.extra['menu_template'] if 'menu_template' in meta_data.extra else 'default',
+                visible=meta_data.extra.get('menu_visible', True)  # 控制插件是否在菜单中展示
+            )
+        except error_wrappers.ValidationError as e:
+            logger.opt(colors=True).error(f'<y>{plugin_name}</y> 菜单数据加载失败 <c>(from code)</c>\n'
+                                          f'<y>__plugin_meta__.extra["menu_data"] 缺少必要键值对</y>: \n'
+                                          f'{e}')
+            return None
+        logger.opt(colors=True).success(f'<y>{plugin_name}</y> 菜单数据已加载 <c>(from code)</c>')
+        return plugin_data
+
+    def get_main_menu_data(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """
+        获取生成主菜单的信息
+        :return: 元组（元组[插件名]，元组[插件描述]），只包含可见插件
+        """
+        index = self.index
+        if trace_data.enabled:
+            trace_data.emit('main_menu_data', plugins=len(index.plugins), visible=len(index.visible))
+        return index.main_menu_data
+
+    def resolve(self, plugin_name: str, func: Optional[str] = None
+                ) -> Tuple[PluginIndex, Union[Tuple[int, Optional[int]], str]]:
+        """
+        说明: 解析插件名/序号及功能名/序号，重复的查询直接使用缓存的解析结果，不再进行模糊匹配
+        :param plugin_name: 插件名/序号
+        :param func: 功能名/序号，为空时只解析插件
+        :return: 元组（解析时使用的索引，（插件位置，功能位置）或异常字符串）
+        """
+        index = self.index
+        key = (plugin_name, func)
+        result = self.query_cache.get(index.data_version, key)
+        cached = result is not None
+        if not cached:
+            result = index.find_plugin(plugin_name)
+            if not isinstance(result, str):
+                func_index = None if func is None else index.find_func(result, func)
+                result = func_index if isinstance(func_index, str) else (result, func_index)
+            self.query_cache.put(index.data_version, key, result)
+        if trace_data.enabled:
+            trace_data.emit('resolve', plugin=plugin_name, func=func, result=result, cached=cached,
+                            data_version=index.data_version)
+        return index, result
 
     def get_plugin_menu_data(self, plugin_name: str) -> Union[PluginMenuData, PluginMetadata, str]:
         """
@@ -150,85 +570,259 @@ class DataManager(object):
         :param plugin_name: 插件名
         :return:
         """
-        print(f"[DEBUG] 获取插件菜单数据: {plugin_name}")
-
-        # 过滤出可见的插件
-        visible_plugins = [plugin for plugin in self.plugin_menu_data_list if plugin.visible]
-        visible_names = [plugin.name for plugin in visible_plugins]
-
-        if plugin_name.isdigit():  # 判断是否为下标，是则进行下标索引，否则进行模糊匹配
-            index = int(plugin_name) - 1
-            if 0 <= index < len(visible_plugins):  # 使用可见插件列表进行索引
-                print(f"[DEBUG] 通过索引找到插件: {visible_plugins[index].name}")
-                return visible_plugins[index]
-            else:  # 超限处理
-                print(f"[DEBUG] 插件索引超出范围: {index}, 可见插件数量: {len(visible_plugins)}")
-                return 'PluginIndexOutRange'
-        else:  # 模糊匹配
-            result = fuzzy_match_and_check(plugin_name, visible_names)  # 使用可见插件名列表进行匹配
-            # 空值返回异常字符串
-            if result is None:
-                print(f"[DEBUG] 无法匹配插件名: {plugin_name}")
-                return 'CannotMatchPlugin'
-            else:
-                plugin = next(filter(lambda x: result == x.name, visible_plugins))  # 使用可见插件列表进行过滤
-                print(f"[DEBUG] 通过模糊匹配找到插件: {plugin.name}")
-                return plugin
+        index, result = self.resolve(plugin_name)
+        if trace_data.enabled:
+            trace_data.emit('plugin_menu_data', query=plugin_name,
+                            result=result if isinstance(result, str) else index.plugins[result[0]].name)
+        if isinstance(result, str):  # 异常字符串
+            return result
+        return index.plugins[result[0]]
 
-    def get_command_details_data(self, plugin_data: PluginMenuData, func: str):
+    def get_command_details_data(self, plugin_data: PluginMenuData, func: str) -> Union[FuncData, str]:
         """
         获取生成命令详细菜单的数据
         :param plugin_data: 插件名（从聊天中直接获得的初始数据）
         :param func: 命令（从聊天中直接获得的初始数据）
         :return:
         """
-        funcs = plugin_data.funcs
-        if func.isdigit():  # 判断是否为下标，是则进行下标索引，否则进行模糊匹配
-            index = int(func) - 1
-            if 0 <= index < len(funcs):
-                return funcs[index]
-            else:  # 超限处理
-                return 'CommandIndexOutRange'
-        else:
-            func_list = [func.func for func in funcs]  # 功能名的列表
-            fuzzy_func = fuzzy_match_and_check(func, func_list)  # 模糊匹配
-            if fuzzy_func is not None:
-                return next(filter(lambda x: fuzzy_func == x.func, funcs))
-            else:  # 过于模糊
-                return 'CannotMatchCommand'
+        index = self.index
+        position = index.position(plugin_data)
+        if position is None:  # 不是当前加载的插件数据时临时建立索引
+            index, position = PluginIndex([plugin_data]), 0
+        func_index = index.find_func(position, func)
+        return func_index if isinstance(func_index, str) else plugin_data.funcs[func_index]
 
 
 class TemplateManager(object):
     def __init__(self):
-        self.template_container = {'default': DefaultTemplate}  # 模板装载对象
+        self.template_container = {}  # 模板装载对象，首次选择模板时加载
         self.templates_path = Path.cwd() / 'menu_config' / 'template'  # 模板路径
-        self.load_templates()
+        self._identities: Dict[str, list] = {}  # 模板名 -> 模板文件信息
+        self._lock = threading.Lock()
 
     def load_templates(self):  # 从文件加载模板
+        from .template import DefaultTemplate
+        template_container = {'default': DefaultTemplate}
         template_list = [template for template in self.templates_path.glob('*.py')]
         template_name_list = [template.stem for template in self.templates_path.glob('*.py')]
         for template_name, template_path in zip(template_name_list, template_list):
             template_spec = importlib.util.spec_from_file_location(template_name, template_path)
             template = importlib.util.module_from_spec(template_spec)
             template_spec.loader.exec_module(template)
-            self.template_container.update({template_name: template.DefaultTemplate})
+            template_container.update({template_name: template.DefaultTemplate})
+        # 全部加载完成后整体替换，防止其他渲染线程读到加载了一半的模板
+        self.template_container = template_container
 
-    def select_template(self, template_name: str) -> PicTemplate:  # 选择模板
+    def select_template(self, template_name: str) -> 'PicTemplate':  # 选择模板
+        if not self.template_container:  # 首次渲染时才导入默认模板并执行用户模板
+            with self._lock:
+                if not self.template_container:
+                    self.load_templates()
         if template_name in self.template_container:
             return self.template_container[template_name]
         else:
             raise KeyError(f'There is no template named {template_name}')
 
+    def template_identity(self, template_name: str) -> list:
+        """
+        说明: 读取模板代码及绘图代码的文件信息，代码变化后磁盘缓存随之失效
+        模板只加载一次，文件信息同样在首次使用时读取，运行中修改的模板重启后生效
+        :param template_name: 模板名
+        :return: 列表[[文件路径，文件大小，修改时间]]
+        """
+        identity = self._identities.get(template_name)
+        if identity is not None:
+            return identity
+        files = list(RENDER_SOURCES)
+        if template_name != 'default':
+            files.append(self.templates_path / f'{template_name}.py')
+        identity = []
+        for file in files:
+            try:
+                stat = os.stat(file)
+                identity.append([str(file), stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                identity.append([str(file)])
+        return self._identities.setdefault(template_name, identity)
+
 
 class MenuManager(object):  # 菜单总管理
-    def __init__(self):
+    def __init__(self, config: Config = None):
         self.cwd = Path.cwd()
+        self.config = config if config is not None else Config()
+        configure_tracing(self.config.menu_trace.split(','), self.config.menu_trace_sample)
         self.config_folder_make()
         self.data_manager = DataManager()
         self.template_manager = TemplateManager()
+        self.page_size = max(0, self.config.menu_page_size)
+        self.main_columns = max(0, self.config.menu_main_columns)
+        self.render_cache = RenderCache(self.config.menu_cache_size, self.config.menu_cache_memory)
+        self.data_manager.query_cache.max_entries = self.config.menu_query_cache_size
+        # Pillow 及绘图模块在首次渲染或编码时导入，届时再应用字体、文本缓存配置并创建图片编码器
+        self._encoder: Optional['ImageEncoder'] = None
+        self._render_lock = threading.Lock()
+        if self.config.menu_snapshot:
+            self.data_manager.snapshot_path = self.cwd / 'menu_config' / 'cache' / SNAPSHOT_FILE
+        # 可选的多进程渲染后端
+        self.process_pool: Optional[ProcessRenderPool] = None
+        if self.config.menu_render_backend == 'process':
+            if ProcessRenderPool.available():
+                self.process_pool = ProcessRenderPool(self.config.menu_render_processes,
+                                                      self.config.menu_render_timeout)
+            else:
+                logger.warning('当前平台不支持 fork，菜单渲染使用线程后端')
+        # Pillow 渲染为同步操作，放在独立线程池中执行，避免阻塞事件循环
+        # 多进程后端下每个渲染线程等待一个渲染进程，线程数量至少为渲染进程数量，使所有渲染进程都能被用上
+        render_workers = max(1, self.config.menu_render_workers)
+        if self.process_pool is not None:
+            render_workers = max(render_workers, self.process_pool.workers)
+        self.executor = ThreadPoolExecutor(max_workers=render_workers, thread_name_prefix='PicMenu')
+        self.encode_stats = {'count': 0, 'seconds': 0.0, 'bytes': 0}
+        self._stats_lock = threading.Lock()
+        # 磁盘缓存
+        self.disk_cache: Optional[DiskCache] = None
+        self.font_identity = self.load_font_identity()
+        if self.config.menu_disk_cache:
+            self.disk_cache = DiskCache(self.cwd / 'menu_config' / 'cache',
+                                        self.config.menu_disk_cache_size,
+                                        self.config.menu_disk_cache_days)
+            self.executor.submit(self.disk_cache.gc)
+        # 发送方式
+        self.transport = self.config.menu_transport
+        if self.transport not in ('base64', 'file', 'bytes'):
+            logger.error(f'菜单图片发送方式配置错误: {self.transport}，使用base64发送')
+            self.transport = 'base64'
+        self.file_store: Optional[DiskCache] = None
+        if self.transport == 'file':
+            file_dir = Path(self.config.menu_transport_dir) if self.config.menu_transport_dir \
+                else self.cwd / 'menu_config' / 'files'
+            self.file_store = DiskCache(file_dir.resolve(),
+                                        self.config.menu_disk_cache_size,
+                                        self.config.menu_disk_cache_days)
+            self.executor.submit(self.file_store.gc)
 
     def load_plugin_info(self):
         self.data_manager.load_plugin_info()
+        # 插件信息重新加载后旧图片全部失效
+        self.render_cache.clear()
+        font_identity = self.load_font_identity()
+        # 字体文件变化后已加载的字体及文本图片失效，尚未导入绘图模块时没有需要清除的缓存
+        if font_identity != self.font_identity and self._encoder is not None:
+            from .img_tool import font_registry, text_cache
+            font_registry.clear()
+            text_cache.clear()
+        self.font_identity = font_identity
+        if self.process_pool is not None:
+            self.process_pool.start(self.data_manager.plugin_menu_data_list, self.data_manager.data_version,
+                                    self.encoder)
+
+    def reload_changed(self) -> bool:
+        """
+        说明:
+            重新加载发生变化的 menus/*.json，只删除受影响插件的二、三级菜单缓存，
+            可见插件的插件名、描述或可见性变化时同时删除一级菜单缓存，其余缓存图片沿用到新的数据版本
+        :return: 是否有插件的菜单数据发生变化
+        """
+        result = self.data_manager.reload_changed()
+        if result is None:
+            return False
+        old_index, index, changed_names = result
+        keep_main = old_index.main_menu_data == index.main_menu_data
+
+        def rekey(key: tuple) -> Optional[tuple]:
+            # 缓存键：（菜单级别，插件位置，功能序号，模板名，数据版本，页码[，'image']）
+            if key[4] != old_index.data_version:
+                return key
+            if key[0] == 'main':
+                return (*key[:4], index.data_version, *key[5:]) if keep_main else None
+            plugin_data = old_index.plugins[key[1]]
+            if plugin_data.name in changed_names:
+                return None
+            # 未变化的插件沿用原数据对象，按对象查找其在新插件列表中的位置
+            position = index.position(plugin_data)
+            if position is None:
+                return None
+            return (key[0], position, *key[2:4], index.data_version, *key[5:])
+
+        kept = self.render_cache.rekey(rekey)
+        if self.process_pool is not None:
+            self.process_pool.start(self.data_manager.plugin_menu_data_list, self.data_manager.data_version,
+                                    self.encoder)
+        logger.opt(colors=True).info(f'菜单数据已更新: <y>{", ".join(sorted(changed_names))}</y>，'
+                                     f'一级菜单{"未" if keep_main else "已"}变化，保留 <y>{kept}</y> 张缓存图片')
+        return True
+
+    async def watch(self):
+        """
+        说明: 按 menu_watch_interval 定期检查 menus/*.json 的变化并重新加载
+        """
+        interval = self.config.menu_watch_interval
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_sync(self.reload_changed)
+            except Exception as e:
+                logger.opt(colors=True).warning(f'检查菜单数据变化失败: {e}')
+
+    def setup_render(self):
+        """
+        说明: 首次渲染或编码时导入 Pillow 及绘图模块，应用字体、文本缓存配置并创建图片编码器
+        """
+        if self._encoder is not None:
+            return
+        with self._render_lock:
+            if self._encoder is not None:
+                return
+            from .img_tool import ImageEncoder, font_registry, text_cache
+            font_registry.max_fonts = self.config.menu_font_cache_size
+            text_cache.max_entries = self.config.menu_text_cache_size
+            try:
+                encoder = ImageEncoder(self.config.menu_image_format,
+                                       self.config.menu_image_compress_level,
+                                       self.config.menu_image_quality,
+                                       self.config.menu_image_max_size * 1024)
+            except ValueError as e:
+                logger.error(f'菜单图片编码配置错误: {e}，使用PNG编码')
+                encoder = ImageEncoder()
+            self._encoder = encoder
+
+    @property
+    def encoder(self) -> 'ImageEncoder':
+        """
+        说明: 图片编码器，首次使用时导入绘图模块
+        """
+        self.setup_render()
+        return self._encoder
+
+    def render_image(self, task: MenuTask, index: PluginIndex) -> 'Img':
+        """
+        说明: 在当前线程渲染任务
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: Image对象
+        """
+        self.setup_render()
+        return render_task(task, index.plugins, self.template_manager)
+
+    async def run_sync(self, func: Callable, *args) -> Any:
+        """
+        说明: 在渲染线程池中执行同步函数并等待结果
+        :param func: 同步函数
+        :param args: 函数参数
+        :return: 函数返回值
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def shutdown(self):
+        """
+        说明: 关闭渲染线程池及渲染进程
+        """
+        self.executor.shutdown(wait=False)
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
 
     # 初始化文件结构
     def config_folder_make(self):
@@ -240,41 +834,293 @@ class MenuManager(object):  # 菜单总管理
             (self.cwd / 'menu_config' / 'templates').mkdir()
         if not (self.cwd / 'menu_config' / 'menus').exists():
             (self.cwd / 'menu_config' / 'menus').mkdir()
+        if not (self.cwd / 'menu_config' / 'cache').exists():
+            (self.cwd / 'menu_config' / 'cache').mkdir()
         if not (self.cwd / 'menu_config' / 'config.json').exists():
             with (self.cwd / 'menu_config' / 'config.json').open('w', encoding='utf-8') as fp:
                 fp.write(json.dumps({'default': 'font_path'}))
 
-    def generate_main_menu_image(self) -> Image:  # 生成主菜单图片
-        print("[DEBUG] 开始生成主菜单图片")
-        data = self.data_manager.get_main_menu_data()
-        print(f"[DEBUG] 获取到的主菜单数据: {data}")
-        template = self.template_manager.select_template('default')
-        print(f"[DEBUG] 选择的模板: {template}")
-        result = template().generate_main_menu(data)
-        print(f"[DEBUG] 生成的图片类型: {type(result)}")
-        return result
-
-    def generate_plugin_menu_image(self, plugin_name) -> Image:  # 生成二级菜单图片
-        init_data = self.data_manager.get_plugin_menu_data(plugin_name)
-        if isinstance(init_data, str):  # 判断是否匹配到插件
-            return init_data
-        else:
-            template = self.template_manager.select_template(init_data.template)  # 获取模板
-            if init_data.funcs is not None:
-                return template().generate_plugin_menu(init_data)
-            else:
-                return template().generate_original_plugin_menu(init_data)
+    def load_font_identity(self) -> list:
+        """
+        说明: 读取字体配置及字体文件信息，字体文件变化后磁盘缓存随之失效
+        :return: 列表[[配置名，字体路径，文件大小，修改时间]]
+        """
+        try:
+            with (self.cwd / 'menu_config' / 'config.json').open('r', encoding='utf-8') as fp:
+                config = json.loads(fp.read())
+        except (OSError, ValueError):
+            return []
+        identity = []
+        for name, font in sorted(config.items()):
+            try:
+                stat = os.stat(font)
+                identity.append([name, font, stat.st_size, stat.st_mtime_ns])
+            except (OSError, TypeError):
+                identity.append([name, str(font)])
+        return identity
 
-    def generate_func_details_image(self, plugin_name, func) -> Image:  # 生成三级菜单图片
-        plugin_data = self.data_manager.get_plugin_menu_data(plugin_name)
-        if isinstance(plugin_data, str):  # 判断是否匹配到插件
-            return plugin_data
-        else:
-            if isinstance(plugin_data, PluginMetadata):
-                return 'PluginNoFuncData'
-            init_data = self.data_manager.get_command_details_data(plugin_data, func)
-        if isinstance(init_data, str):  # 判断是否匹配到功能
-            return init_data
+    def disk_cache_key(self, task: MenuTask, index: PluginIndex) -> str:
+        """
+        说明: 根据菜单内容、模板名及模板代码、字体文件及渲染参数计算磁盘缓存键
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: sha256字符串
+        """
+        plugin_menu_data_list = index.plugins
+        if task.level == 'main':
+            content = [[plugin.name, plugin.description] for plugin in index.visible]
+            if task.page > 0:
+                start = (task.page - 1) * task.page_size
+                content = [task.page, page_count(len(content), task.page_size), start,
+                           content[start:start + task.page_size]]
+            if task.columns != 1:
+                content = [task.columns, content]
+        elif task.level == 'plugin':
+            content = plugin_menu_data_list[task.plugin_index].dict()
         else:
-            template = self.template_manager.select_template(plugin_data.template)  # 获取模板
-            return template().generate_command_details(init_data)
+            content = plugin_menu_data_list[task.plugin_index].funcs[task.func_index].dict()
+        raw = json.dumps([DISK_CACHE_VERSION, task.level, task.template,
+                          self.template_manager.template_identity(task.template), self.font_identity,
+                          self.encoder.options(), content],
+                         ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def main_menu_task(self, index: PluginIndex, page: int = 1) -> Union[MenuTask, str]:
+        """
+        说明: 生成一级菜单的渲染任务
+        :param index: 插件信息索引
+        :param page: 页码，未启用分页时忽略
+        :return: MenuTask对象，页码超出范围时返回异常字符串
+        """
+        data_version = index.data_version
+        if self.page_size <= 0:
+            return MenuTask('main', None, None, None, 'default', data_version, columns=self.main_columns)
+        if not 1 <= page <= page_count(len(index.visible), self.page_size):
+            return 'PageOutRange'
+        return MenuTask('main', None, None, None, 'default', data_version, page, self.page_size, self.main_columns)
+
+    def resolve_menu(self, plugin_name: Optional[str] = None, func: Optional[str] = None
+                     ) -> Tuple[PluginIndex, Union[MenuTask, str]]:
+        """
+        说明: 将查询解析为渲染任务
+        任务中的位置只在解析时使用的索引中有效，渲染及计算磁盘缓存键时需使用同一索引，
+        否则解析后插件信息被重新加载会渲染出其他插件的菜单
+        :param plugin_name: 插件名/序号/一级菜单页码（如 p2），为空时为一级菜单
+        :param func: 功能名/序号，为空时为二级菜单
+        :return: 元组（解析使用的索引，MenuTask对象，匹配失败时为异常字符串）
+        """
+        if plugin_name is None:
+            index = self.data_manager.index
+            return index, self.main_menu_task(index)
+        if func is None and self.page_size > 0 and (match := PAGE_PATTERN.fullmatch(plugin_name)):
+            index = self.data_manager.index
+            if plugin_name not in index.names:  # 与可见插件名相同时优先作为插件名
+                return index, self.main_menu_task(index, int(match.group(1)))
+        index, result = self.data_manager.resolve(plugin_name, func)
+        if isinstance(result, str):  # 判断是否匹配到插件及功能
+            return index, result
+        # 功能名可能重复，使用功能在插件中的位置作为缓存键
+        plugin_index, func_index = result
+        plugin_data = index.plugins[plugin_index]
+        return index, MenuTask('plugin' if func is None else 'func', plugin_index, func_index, plugin_data.name,
+                               plugin_data.template, index.data_version)
+
+    def record_encode(self, fmt: str, size: int, seconds: float):
+        """
+        说明: 记录一次编码的耗时及输出大小
+        :param fmt: 实际使用的格式
+        :param size: 输出字节数
+        :param seconds: 编码耗时
+        """
+        with self._stats_lock:
+            self.encode_stats['count'] += 1
+            self.encode_stats['seconds'] += seconds
+            self.encode_stats['bytes'] += size
+        logger.debug(f'菜单图片编码完成: {fmt} {size} bytes, 耗时 {seconds * 1000:.1f}ms')
+
+    def encode(self, img: 'Img') -> bytes:
+        """
+        说明: 使用配置的编码器编码图片
+        :param img: Image对象
+        :return: 编码后的图片数据
+        """
+        start = time.perf_counter()
+        data, fmt = self.encoder.encode(img)
+        self.record_encode(fmt, len(data), time.perf_counter() - start)
+        return data
+
+    def render_entry(self, task: MenuTask, index: PluginIndex) -> CacheEntry:
+        """
+        说明: 渲染并编码任务，启用多进程后端时由渲染进程返回编码后的数据
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: CacheEntry对象
+        :raise TimeoutError: 渲染进程超时未返回结果，不在当前线程重新渲染同一任务
+        """
+        if self.process_pool is not None:
+            result = self.process_pool.render(task)
+            if result is not None:
+                data, fmt, seconds = result
+                self.record_encode(fmt, len(data), seconds)
+                return CacheEntry(data=data)
+            # 渲染进程中的插件信息与任务版本不一致，在当前线程按任务的索引渲染
+        return CacheEntry(data=self.encode(self.render_image(task, index)))
+
+    def load_entry(self, task: MenuTask, index: PluginIndex) -> CacheEntry:
+        """
+        说明: 从磁盘缓存读取菜单，未命中时渲染并写入磁盘缓存
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: CacheEntry对象
+        """
+        if self.disk_cache is None:
+            return self.render_entry(task, index)
+        disk_key = self.disk_cache_key(task, index)
+        data = self.disk_cache.get(disk_key)
+        if data is not None:
+            return CacheEntry(data=data)
+        entry = self.render_entry(task, index)
+        self.disk_cache.put(disk_key, entry.data)
+        return entry
+
+    def make_payload(self, data: bytes) -> Union[str, Path, bytes]:
+        """
+        说明: 按配置的发送方式生成 MessageSegment.image 使用的图片
+        file 方式下文件名为图片内容的哈希，内容未变化的菜单复用同一文件
+        :param data: 编码后的图片数据
+        :return: base64字符串/文件路径/图片数据
+        """
+        from .img_tool import bytes2b64, image_suffix
+        if self.transport == 'bytes':
+            return data
+        if self.transport == 'file':
+            file = self.file_store.file(hashlib.sha256(data).hexdigest() + image_suffix(data), data)
+            if file is not None:
+                return file
+            # 写入失败时使用base64发送
+        return 'base64://' + bytes2b64(data)
+
+    def get_menu(self, plugin_name: Optional[str] = None, func: Optional[str] = None) -> Union[CacheEntry, str]:
+        """
+        说明: 获取菜单图片及发送用的图片，优先从渲染缓存中获取，需在渲染线程中调用
+        :param plugin_name: 插件名/序号，为空时为一级菜单
+        :param func: 功能名/序号，为空时为二级菜单
+        :return: CacheEntry对象，匹配失败时返回异常字符串
+        """
+        index, task = self.resolve_menu(plugin_name, func)
+        if isinstance(task, str):
+            return task
+        return self.get_entry(task, index)
+
+    def get_entry(self, task: MenuTask, index: PluginIndex) -> CacheEntry:
+        """
+        说明: 获取渲染任务对应的缓存条目，依次查找内存缓存、磁盘缓存，均未命中时渲染
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: CacheEntry对象
+        """
+        entry = self.render_cache.get(task.key)
+        if entry is None:
+            entry = self.load_entry(task, index)
+            self.render_cache.put(task.key, entry)
+        if entry.payload is None:
+            self.render_cache.set_payload(task.key, entry, self.make_payload(entry.data))
+        elif isinstance(entry.payload, Path):
+            # 文件可能已被清理，刷新修改时间，不存在时重新写入
+            self.file_store.file(entry.payload.name, entry.data)
+        return entry
+
+    def warm_up_tasks(self, index: PluginIndex) -> List[MenuTask]:
+        """
+        说明: 列出所有可见菜单的渲染任务
+        热门菜单放在最后，使其在内存缓存中保留最久
+        :param index: 插件信息索引
+        :return: MenuTask列表（三级菜单，二级菜单，一级菜单）
+        """
+        data_version = index.data_version
+        plugin_tasks, func_tasks = [], []
+        for plugin_index in index.visible_positions:
+            plugin = index.plugins[plugin_index]
+            plugin_tasks.append(MenuTask('plugin', plugin_index, None, plugin.name, plugin.template, data_version))
+            for func_index in range(len(plugin.funcs or [])):
+                func_tasks.append(MenuTask('func', plugin_index, func_index, plugin.name, plugin.template,
+                                           data_version))
+        # 一级菜单第一页最常用，放在最后
+        pages = page_count(len(index.visible), self.page_size)
+        main_tasks = [self.main_menu_task(index, page) for page in range(pages, 0, -1)]
+        return func_tasks + plugin_tasks + main_tasks
+
+    async def warm_up(self):
+        """
+        说明: 在后台预渲染所有菜单，同时渲染的数量受 menu_warm_up_concurrency 限制，
+            其余渲染线程留给用户请求
+            字体无法加载等导致所有菜单都会失败的错误只提示一次，并停止预渲染
+        """
+        index = self.data_manager.index
+        tasks = self.warm_up_tasks(index)
+        if not tasks:
+            return
+        semaphore = asyncio.Semaphore(max(1, self.config.menu_warm_up_concurrency))
+        start = time.perf_counter()
+        step = max(1, len(tasks) // 10)
+        done = 0
+        failure: Optional[Exception] = None
+
+        async def warm(task: MenuTask):
+            nonlocal done, failure
+            async with semaphore:
+                if failure is not None or task.data_version != self.data_manager.data_version:
+                    return  # 预渲染已停止，或预渲染期间插件信息被重新加载
+                try:
+                    await self.run_sync(self.get_entry, task, index)
+                except Exception as e:
+                    # 字体未配置或无法读取时其余菜单同样会失败，渲染进程超时只影响该菜单
+                    if isinstance(e, OSError) and not isinstance(e, TimeoutError):
+                        if failure is None:
+                            failure = e
+                            logger.opt(colors=True).warning(
+                                f'预渲染菜单 <y>{task.level} {task.plugin_name or ""}</y> 失败: {e}，停止预渲染')
+                        return
+                    logger.opt(colors=True).warning(f'预渲染菜单 <y>{task.level} {task.plugin_name or ""}</y> 失败: {e}')
+            done += 1
+            if done % step == 0 or done == len(tasks):
+                logger.opt(colors=True).info(f'菜单预渲染进度 <y>{done}/{len(tasks)}</y>')
+
+        await asyncio.gather(*(warm(task) for task in tasks))
+        if failure is not None:
+            return
+        logger.opt(colors=True).success(f'菜单预渲染完成，共 <y>{len(tasks)}</y> 张，'
+                                        f'耗时 <y>{time.perf_counter() - start:.2f}s</y>')
+        if self._encoder is not None:
+            from .img_tool import text_cache
+            logger.debug(f'文本图片缓存: {text_cache.stats()}')
+
+    def cached_render(self, task: MenuTask, index: PluginIndex) -> 'Img':
+        """
+        说明: 从渲染缓存中获取图片，未命中时在当前线程渲染
+        :param task: MenuTask对象
+        :param index: 生成任务时使用的索引
+        :return: Image对象
+        """
+        key = (*task.key, 'image')  # 与编码后的条目分开保存
+        entry = self.render_cache.get(key)
+        if entry is None:
+            entry = CacheEntry(img=self.render_image(task, index))
+            self.render_cache.put(key, entry)
+        return entry.img
+
+    def generate_main_menu_image(self) -> 'Img':  # 生成主菜单图片
+        index, task = self.resolve_menu()
+        return self.cached_render(task, index)
+
+    def generate_plugin_menu_image(self, plugin_name) -> 'Img':  # 生成二级菜单图片
+        index, task = self.resolve_menu(plugin_name)
+        if isinstance(task, str):  # 判断是否匹配到插件
+            return task
+        return self.cached_render(task, index)
+
+    def generate_func_details_image(self, plugin_name, func) -> 'Img':  # 生成三级菜单图片
+        index, task = self.resolve_menu(plugin_name, func)
+        if isinstance(task, str):  # 判断是否匹配到插件和功能
+            return task
+        return self.cached_render(task, index)
@@ -0,0 +1,120 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+NON_WORD_PATTERN = re.compile(r'(?ui)\W')  # 与 fuzzywuzzy 的预处理一致，非文字字符视为空格
+MATCH_THRESHOLD = 45  # 置信度低于该值时视为无法匹配
+
+
+def normalize_name(text: str) -> str:
+    """
+    说明: 名称归一化，全角字符转为半角（NFKC），忽略大小写，非文字字符替换为空格
+    :param text: 名称
+    :return: 归一化后的名称
+    """
+    return NON_WORD_PATTERN.sub(' ', unicodedata.normalize('NFKC', text).casefold()).strip()
+
+
+def bigrams(text: str) -> Set[str]:
+    """
+    说明: 相邻两字符集合，空格（原为符号）也参与组成二元组，与评分时看到的字符串一致
+    :param text: 归一化后的名称
+    :return: 二元组集合
+    """
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class FuzzyIndex(object):
+    def __init__(self, names: Iterable[str], candidate_limit: int = 64):
+        """
+        说明:
+            名称模糊搜索索引，创建后只读，可在多个线程中使用
+            查询时先用归一化名称直接匹配，再通过二元组（查询过短时为单字符）倒排表选出少量候选，
+            只对候选名称依次使用 partial_ratio、WRatio、ratio 评分
+            名称数量不超过候选上限时全部名称都是候选，不建立倒排表，评分结果与对全部名称评分一致
+            超过候选上限时匹配质量不低于对全部名称评分，但结果可能不同，
+            如1000个名称时查询 HELP 得到 help，原实现对全部名称评分得到 Pichelp
+        参数:
+            :param names: 名称列表
+            :param candidate_limit: 参与评分的候选名称数量上限
+        """
+        self.names: List[str] = list(names)
+        self.candidate_limit = candidate_limit
+        self._normalized = [normalize_name(x) for x in self.names]
+        self._positions: Dict[str, int] = {}  # 名称 -> 下标，重名时取第一个
+        self._normalized_positions: Dict[str, int] = {}  # 归一化名称 -> 下标
+        self._bigrams: Dict[str, List[int]] = defaultdict(list)  # 二元组倒排表
+        self._chars: Dict[str, List[int]] = defaultdict(list)  # 单字符倒排表
+        indexed = len(self.names) > candidate_limit
+        for i, (name, normalized) in enumerate(zip(self.names, self._normalized)):
+            self._positions.setdefault(name, i)
+            self._normalized_positions.setdefault(normalized, i)
+            if not indexed:
+                continue
+            for gram in bigrams(normalized):
+                self._bigrams[gram].append(i)
+            for cha in set(normalized.replace(' ', '')):
+                self._chars[cha].append(i)
+        self._bigrams = dict(self._bigrams)
+        self._chars = dict(self._chars)
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, normalized: str) -> List[int]:
+        """
+        说明: 按共有二元组数量（相同时按共有字符数量、长度差、原顺序）选出候选名称
+        :param normalized: 归一化后的查询
+        :return: 候选名称下标，按原顺序排列
+        """
+        if len(self.names) <= self.candidate_limit:
+            # 没有共同字符的名称评分为0，不会成为结果，全部参与评分与只对有共同字符的名称评分结果一致
+            return list(range(len(self.names)))
+        gram_counts = Counter()
+        for gram in bigrams(normalized):
+            for i in self._bigrams.get(gram, ()):
+                gram_counts[i] += 1
+        cha_counts = Counter()
+        if len(gram_counts) < self.candidate_limit:  # 候选不足时补充有共同字符的名称
+            for cha in set(normalized.replace(' ', '')):
+                for i in self._chars.get(cha, ()):
+                    cha_counts[i] += 1
+        ids = set(gram_counts) | set(cha_counts)
+        if len(ids) > self.candidate_limit:
+            length = len(normalized)
+            ids = sorted(ids, key=lambda x: (-gram_counts[x], -cha_counts[x], abs(len(self._normalized[x]) - length), x)
+                         )[:self.candidate_limit]
+        return sorted(ids)
+
+    def search(self, query: str) -> Optional[int]:
+        """
+        说明: 查找最合适的名称
+        :param query: 查询
+        :return: 名称下标，置信度过小返回None
+        """
+        from fuzzywuzzy import process, fuzz  # 首次查询时导入
+        if query in self._positions:  # 在列表中直接返回结果
+            return self._positions[query]
+        normalized = normalize_name(query)
+        if not normalized:
+            return None
+        if normalized in self._normalized_positions:  # 仅大小写、全半角或符号不同
+            return self._normalized_positions[normalized]
+        choices = {i: self._normalized[i] for i in self.candidates(normalized)}
+        if not choices:
+            return None
+        vague_result = process.extract(normalized, choices, scorer=fuzz.partial_ratio, limit=10)
+        vague_result = process.extract(normalized, {x[2]: x[0] for x in vague_result}, scorer=fuzz.WRatio, limit=10)
+        _, score, position = process.extract(normalized, {x[2]: x[0] for x in vague_result}, scorer=fuzz.ratio,
+                                             limit=1)[0]
+        return position if score >= MATCH_THRESHOLD else None
+
+    def match(self, query: str) -> Optional[str]:
+        """
+        说明: 查找最合适的名称
+        :param query: 查询
+        :return: 名称，置信度过小返回None
+        """
+        position = self.search(query)
+        return None if position is None else self.names[position]
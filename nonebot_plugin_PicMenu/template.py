@@ -1,13 +1,16 @@
 import abc
 import json
 from pathlib import Path
-from typing import Tuple, List
+from typing import Optional, Tuple, List
 
 from PIL import Image
 from nonebot import logger
 
 from .data_struct import PluginMenuData, FuncData
-from .img_tool import simple_text, multi_text, calculate_text_size, ImageFactory, Box, auto_resize_text
+from .img_tool import simple_text, multi_text, calculate_text_size, ImageFactory, Box, auto_resize_text, TextLayout
+from .trace import get_tracer
+
+trace_template = get_tracer('template')
 
 class PicTemplate(metaclass=abc.ABCMeta):  # 模板类
     def __init__(self):
@@ -21,10 +24,15 @@ class PicTemplate(metaclass=abc.ABCMeta):  # 模板类
         pass
 
     @abc.abstractmethod
-    def generate_main_menu(self, data: Tuple[List, List]) -> Image:
+    def generate_main_menu(self, data: Tuple[List, List],
+                           start: int = 1, page: Optional[Tuple[int, int]] = None, columns: int = 1) -> Image:
         """
         生成一级菜单抽象方法
+        启用分页时才会传入 start 与 page 参数，启用多列布局时才会传入 columns 参数
         :param data: Tuple[List(插件名), List(插件des)]
+        :param start: 第一行插件的序号
+        :param page: Tuple(当前页码, 总页数)
+        :param columns: 数据行分组数量，为0时自动选择
         :return: Image对象
         """
         pass
@@ -68,6 +76,9 @@ class DefaultTemplate(PicTemplate):
             'white': (237, 239, 241)
         }
         self.basic_font_size = 25
+        self.main_menu_max_groups = 4  # 一级菜单多列布局的最大分组数量
+        self.main_menu_max_aspect = 2  # 自动选择分组数量时允许的最大长宽比
+        self.main_menu_group_gap = 40  # 一级菜单各组表格的间距
 
     def load_resource(self):
         cwd = Path.cwd()
@@ -75,110 +86,41 @@ class DefaultTemplate(PicTemplate):
             config = json.loads(fp.read())
         self.using_font = config['default']
 
-    def generate_main_menu(self, data) -> Image:
-        print("[DEBUG] 开始生成主菜单图片")
-        print(f"[DEBUG] 收到的数据: {data}")
-
+    def generate_main_menu(self, data, start: int = 1, page: Optional[Tuple[int, int]] = None,
+                           columns: int = 1) -> Image:
         # 检查数据是否有效
         plugin_names, plugin_descriptions = data
         if not plugin_names:
-            print("[ERROR] 插件名列表为空，使用描述列表的索引作为插件名")
+            logger.warning('插件名列表为空，使用描述列表的索引作为插件名')
             plugin_names = [f"插件 {i+1}" for i in range(len(plugin_descriptions))]
             data = (plugin_names, plugin_descriptions)
-            print(f"[DEBUG] 修正后的数据: {data}")
 
-        # 列数
-        column_count = len(data) + 1
         # 数据行数
         row_count = len(data[0])
 
-        print(f"[DEBUG] 生成主菜单，插件数量: {row_count}")
-        for i in range(row_count):
-            print(f"[DEBUG] 插件 {i+1}: {data[0][i]}, 描述: {data[1][i]}")
-        # 数据及表头尺寸测算
-        row_size_list = [tuple(
-                map(lambda _x: calculate_text_size(_x, self.basic_font_size, self.using_font),
-                    ('序号', '插件名', '插件描述'))
-        )]
-        # 计算id，插件名，插件描述的尺寸
-        for x in range(row_count):
-            index_size = calculate_text_size(str(x + 1), self.basic_font_size, self.using_font)
-            plugin_name_size = calculate_text_size(data[0][x], self.basic_font_size, self.using_font)
-            plugin_description_size = multi_text(data[1][x],
-                                                 default_font=self.using_font,
-                                                 default_size=25,
-                                                 box_size=(300, 0)
-                                                 ).size
-            row_size_list.append((index_size, plugin_name_size, plugin_description_size))
-        # 单元格边距
-        margin = 10
-        # 确定每行的行高
-        row_height_list = [max(map(lambda i: i[1], row_size_list[x])) + margin * 2 for x in range(row_count + 1)]
-        # 确定每列的列宽
-        col_max_width_tuple = (
-            max((x[0][0] + margin * 2 for x in row_size_list)),
-            max((x[1][0] + margin * 2 for x in row_size_list)),
-            max((x[2][0] + margin * 2 for x in row_size_list))
-        )
-        # 确定表格底版的长和宽
+        if trace_template.enabled:
+            trace_template.emit('main_menu', rows=row_count, start=start, page=page, columns=columns)
+        description_layouts, row_height_list, col_max_width_tuple = self.measure_main_menu(data, start)
+        # 确定表格底版的宽度
         table_width = sum(col_max_width_tuple) + 3
-        table_height = sum(row_height_list) + 3
-        table = ImageFactory(
-            Image.new('RGBA', (table_width, table_height), self.colors['white'])
-        )
-        # 绘制基点和移动锚点
-        initial_point, basis_point = (1, 1), [1, 1]
-        # 为单元格添加box和绘制边框
-        for row_id in range(row_count + 1):
-            for col_id in range(column_count):
-                box_size = (col_max_width_tuple[col_id], row_height_list[row_id])
-                table.add_box(f'box_{row_id}_{col_id}',
-                              tuple(basis_point),
-                              tuple(box_size))
-                table.rectangle(f'box_{row_id}_{col_id}', outline=self.colors['blue'], width=2)
-                basis_point[0] += box_size[0]
-            basis_point[0] = initial_point[0]
-            basis_point[1] += row_height_list[row_id]
-        # 向单元格中填字
-        for i, text in enumerate(('序号', '插件名', '插件描述')):
-            header = simple_text(text, self.basic_font_size, self.using_font, self.colors['blue'])
-            table.img_paste(
-                header,
-                table.align_box(f'box_0_{i}', header, align='center'),
-                isalpha=True
-            )
-        for x in range(row_count):
-            row_id = x + 1
-            id_text = simple_text(str(row_id), self.basic_font_size, self.using_font, self.colors['blue'])
-            table.img_paste(
-                id_text,
-                table.align_box(f'box_{row_id}_0', id_text, align='center'),
-                isalpha=True
-            )
-            plugin_name_text = simple_text(data[0][x], self.basic_font_size, self.using_font, self.colors['blue'])
-            table.img_paste(
-                plugin_name_text,
-                table.align_box(f'box_{row_id}_1', plugin_name_text, align='center'),
-                isalpha=True
-            )
-            plugin_description_text = multi_text(data[1][x],
-                                                 box_size=(300, 0),
-                                                 default_font=self.using_font,
-                                                 default_color=self.colors['blue'],
-                                                 default_size=self.basic_font_size
-                                                 )
-            table.img_paste(
-                plugin_description_text,
-                table.align_box(f'box_{x+1}_2', plugin_description_text, align='center'),
-                isalpha=True
-            )
-        table_size = table.img.size
+        # 多列布局时将数据行分为多组，每组为一张完整的表格，并排放置
+        if columns == 0:
+            columns = self.choose_main_menu_columns(row_height_list, table_width)
+        groups = self.split_rows(row_height_list[1:], max(1, min(columns, row_count)))
+        # 先计算各组表格尺寸，所有内容直接绘制到最终底版上，不生成中间图片
+        group_sizes = [(table_width, row_height_list[0] + sum(row_height_list[x + 1] for x in rows) + 3)
+                       for rows in groups]
+        table_width = sum(x[0] for x in group_sizes) + self.main_menu_group_gap * (len(groups) - 1)
+        table_size = (table_width, max(x[1] for x in group_sizes))
         # 添加注释
         note_basic_text = simple_text('注：',
                                       size=self.basic_font_size,
                                       color=self.colors['blue'],
                                       font=self.using_font)
-        note_text = multi_text('查询菜单的详细使用方法请发送\n[菜单 PicMenu]',
+        note = '查询菜单的详细使用方法请发送\n[菜单 PicMenu]'
+        if page is not None and page[1] > 1:  # 分页提示
+            note += f'\n第 {page[0]}/{page[1]} 页，发送[菜单 p{page[0] % page[1] + 1}]查看其他页'
+        note_text = multi_text(note,
                                box_size=(table_size[0] - 30 - note_basic_text.size[0] - 10, 0),
                                default_font=self.using_font,
                                default_color=self.colors['blue'],
@@ -186,33 +128,26 @@ class DefaultTemplate(PicTemplate):
                                spacing=4,
                                horizontal_align="middle"
                                )
-        note_img = ImageFactory(
-            Image.new('RGBA',
-                      (note_text.size[0] + 10 + note_basic_text.size[0],
-                       max((note_text.size[1], note_basic_text.size[1]))),
-                      self.colors['white'])
-        )
-        note_img.img_paste(note_basic_text, (0, 0), isalpha=True)
-        note_img.img_paste(note_text, (note_basic_text.size[0] + 10, 0), isalpha=True)
+        note_height = max((note_text.size[1], note_basic_text.size[1]))
         main_menu = ImageFactory(
             Image.new('RGBA',
-                      (table_size[0] + 140, table_size[1] + note_img.img.size[1] + 210),
+                      (table_size[0] + 140, table_size[1] + note_height + 210),
                       color=self.colors['white'])
         )
-        main_menu.img_paste(
-            note_img.img,
-            main_menu.align_box('self', table.img, pos=(0, 140), align='horizontal')
-        )
-        main_menu.img_paste(
-            table.img,
-            main_menu.align_box('self', table.img, pos=(0, 160 + note_img.img.size[1]), align='horizontal')
-        )
+        note_pos = main_menu.align_box('self', table_size, pos=(0, 140), align='horizontal')
+        main_menu.img_paste(note_basic_text, note_pos, isalpha=True)
+        main_menu.img_paste(note_text, (note_pos[0] + note_basic_text.size[0] + 10, note_pos[1]), isalpha=True)
+        pos_x, pos_y = main_menu.align_box('self', table_size, pos=(0, 160 + note_height), align='horizontal')
+        for rows, size in zip(groups, group_sizes):
+            self.draw_main_menu_table(main_menu, (pos_x, pos_y), data, start, rows, row_height_list,
+                                      col_max_width_tuple, description_layouts)
+            pos_x += size[0] + self.main_menu_group_gap
         main_menu.add_box('border_box',
                           main_menu.align_box('self',
-                                              (table_size[0] + 40, table_size[1] + note_img.img.size[1] + 80),
+                                              (table_size[0] + 40, table_size[1] + note_height + 80),
                                               pos=(0, 100),
                                               align='horizontal'),
-                          (table_size[0] + 40, table_size[1] + note_img.img.size[1] + 90))
+                          (table_size[0] + 40, table_size[1] + note_height + 90))
         main_menu.rectangle('border_box', outline=self.colors['blue'], width=5)
         border_box_top_left = main_menu.boxes['border_box'].topLeft
         main_menu.rectangle(Box((border_box_top_left[0] - 25, border_box_top_left[1] - 25),
@@ -222,6 +157,125 @@ class DefaultTemplate(PicTemplate):
         main_menu.img_paste(title, main_menu.align_box('title_box', title, align='center'), isalpha=True)
         return main_menu.img
 
+    def measure_main_menu(self, data: Tuple[List, List], start: int = 1
+                          ) -> Tuple[List[TextLayout], List[int], Tuple[int, int, int]]:
+        """
+        测量一级菜单表格的行高与列宽
+        :param data: Tuple[List(插件名), List(插件des)]
+        :param start: 第一行插件的序号
+        :return: 插件描述的排版结果，所有行的行高（第一项为表头），每列列宽
+        """
+        row_count = len(data[0])
+        # 数据及表头尺寸测算
+        row_size_list = [tuple(
+                map(lambda _x: calculate_text_size(_x, self.basic_font_size, self.using_font),
+                    ('序号', '插件名', '插件描述'))
+        )]
+        # 插件描述排版，测量和绘制使用同一排版结果
+        description_layouts = [TextLayout(data[1][x],
+                                          box_size=(300, 0),
+                                          default_font=self.using_font,
+                                          default_color=self.colors['blue'],
+                                          default_size=self.basic_font_size
+                                          ) for x in range(row_count)]
+        # 计算id，插件名，插件描述的尺寸
+        for x in range(row_count):
+            index_size = calculate_text_size(str(x + start), self.basic_font_size, self.using_font)
+            plugin_name_size = calculate_text_size(data[0][x], self.basic_font_size, self.using_font)
+            row_size_list.append((index_size, plugin_name_size, description_layouts[x].size))
+        # 单元格边距
+        margin = 10
+        # 确定每行的行高
+        row_height_list = [max(map(lambda i: i[1], row_size_list[x])) + margin * 2 for x in range(row_count + 1)]
+        # 确定每列的列宽
+        col_max_width_tuple = (
+            max((x[0][0] + margin * 2 for x in row_size_list)),
+            max((x[1][0] + margin * 2 for x in row_size_list)),
+            max((x[2][0] + margin * 2 for x in row_size_list))
+        )
+        return description_layouts, row_height_list, col_max_width_tuple
+
+    def draw_main_menu_table(self, canvas: ImageFactory, origin: Tuple[int, int], data: Tuple[List, List],
+                             start: int, rows: range, row_height_list: List[int],
+                             col_max_width_tuple: Tuple[int, int, int], description_layouts: List[TextLayout]):
+        """
+        在底版上直接绘制一级菜单中一组数据行的表格（含表头）
+        逐行绘制边框并填字，每行的插件描述图片用完即释放，不生成整张表格的中间图片
+        :param canvas: 最终底版
+        :param origin: 表格左上角在底版上的位置
+        :param data: Tuple[List(插件名), List(插件des)]
+        :param start: 第一行插件的序号
+        :param rows: 该组数据行在 data 中的下标
+        :param row_height_list: 所有行的行高，第一项为表头
+        :param col_max_width_tuple: 每列列宽
+        :param description_layouts: 插件描述的排版结果
+        """
+        # 绘制基点和移动锚点
+        pos_y = origin[1] + 1
+        for row_id, x in enumerate((None, *rows)):
+            row_height = row_height_list[0 if x is None else x + 1]
+            # 为单元格绘制边框
+            cells, pos_x = [], origin[0] + 1
+            for col_width in col_max_width_tuple:
+                cell = Box((pos_x, pos_y), (col_width, row_height))
+                canvas.rectangle(cell, outline=self.colors['blue'], width=2)
+                cells.append(cell)
+                pos_x += col_width
+            # 向单元格中填字
+            if x is None:
+                texts = [simple_text(text, self.basic_font_size, self.using_font, self.colors['blue'])
+                         for text in ('序号', '插件名', '插件描述')]
+            else:
+                texts = [simple_text(str(x + start), self.basic_font_size, self.using_font, self.colors['blue']),
+                         simple_text(data[0][x], self.basic_font_size, self.using_font, self.colors['blue']),
+                         description_layouts[x].render()]
+            for cell, text in zip(cells, texts):
+                canvas.img_paste(text, canvas.align_box(cell, text, align='center'), isalpha=True)
+            pos_y += row_height
+
+    @staticmethod
+    def split_rows(heights: List[int], groups: int) -> List[range]:
+        """
+        按行高将数据行依次分为高度接近的若干组
+        :param heights: 数据行行高
+        :param groups: 组数
+        :return: 每组数据行下标
+        """
+        total = sum(heights)
+        result, begin, end, height = [], 0, 0, 0
+        for group in range(1, groups):
+            # 行的中点落在哪一组的高度范围内，该行就属于哪一组
+            while end < len(heights) and height + heights[end] / 2 < total * group / groups:
+                height += heights[end]
+                end += 1
+            result.append(range(begin, end))
+            begin = end
+        result.append(range(begin, len(heights)))
+        # 没有数据行时保留一组，只绘制表头
+        return [rows for rows in result if rows] or [range(0)]
+
+    def choose_main_menu_columns(self, row_height_list: List[int], table_width: int) -> int:
+        """
+        根据已测量的行高和表格宽度选择一级菜单的分组数量
+        在长宽比不超过 main_menu_max_aspect 的布局中选择总像素最少的，均超过时选择长宽比最接近1的
+        :param row_height_list: 所有行的行高，第一项为表头
+        :param table_width: 单组表格宽度
+        :return: 分组数量
+        """
+        candidates = []
+        for columns in range(1, min(self.main_menu_max_groups, len(row_height_list) - 1) + 1):
+            groups = self.split_rows(row_height_list[1:], columns)
+            # 与 generate_main_menu 中底版的尺寸计算一致，注释部分按估计高度计算
+            width = table_width * len(groups) + self.main_menu_group_gap * (len(groups) - 1) + 140
+            height = row_height_list[0] + max(sum(row_height_list[x + 1] for x in rows) for rows in groups) + 3 + 310
+            aspect = max(width / height, height / width)
+            candidates.append((aspect > self.main_menu_max_aspect, width * height, aspect, columns))
+        if not candidates:
+            return 1
+        if all(x[0] for x in candidates):
+            return min(candidates, key=lambda x: x[2])[3]
+        return min(candidates)[3]
+
     def generate_plugin_menu(self, plugin_data: PluginMenuData) -> Image:
         plugin_name = plugin_data.name
         data = plugin_data.funcs
@@ -239,9 +293,8 @@ class DefaultTemplate(PicTemplate):
         if has_brief_des:
             headers.append('功能简述')
 
-        # 打印调试信息
-        print(f"[DEBUG] 表头: {headers}")
-        print(f"[DEBUG] 有触发方式: {has_trigger_method}, 有功能简述: {has_brief_des}")
+        if trace_template.enabled:
+            trace_template.emit('plugin_menu_headers', headers=headers)
 
         # 数据及表头尺寸测算
         row_size_list = [tuple(
@@ -274,7 +327,7 @@ class DefaultTemplate(PicTemplate):
             if has_brief_des:
                 if func_data.brief_des:
                     # 使用更大的文本框宽度来计算多行文本的大小
-                    brief_des_size = multi_text(func_data.brief_des,
+                    brief_des_size = TextLayout(func_data.brief_des,
                                                 default_font=self.using_font,
                                                 default_size=25,
                                                 box_size=(500, 0),  # 进一步增加文本框宽度
@@ -287,8 +340,8 @@ class DefaultTemplate(PicTemplate):
             # 添加行数据
             row_size_list.append(tuple(row_data))
 
-            # 打印调试信息
-            print(f"[DEBUG] 行 {index+1} 数据: {row_data}")
+            if trace_template.enabled:
+                trace_template.emit('plugin_menu_measure_row', row=index + 1, cell_sizes=row_data)
         # 边距
         margin = 10  # 使用与主菜单相同的边距值
         # 测行高 - 为多行文本提供更多空间
@@ -326,8 +379,8 @@ class DefaultTemplate(PicTemplate):
 
             col_max_width_list.append(col_width)
 
-        # 打印调试信息
-        print(f"[DEBUG] 列宽度: {col_max_width_list}")
+        if trace_template.enabled:
+            trace_template.emit('plugin_menu_columns', widths=col_max_width_list)
 
         # 建立表格画板
         table_width = sum(col_max_width_list) + 3
@@ -339,7 +392,6 @@ class DefaultTemplate(PicTemplate):
 
         # 列数重新计算
         column_count = len(headers)
-        print(f"[DEBUG] 列数: {column_count}")
 
         # 建立基准box
         for row_id in range(row_count + 1):
@@ -360,7 +412,6 @@ class DefaultTemplate(PicTemplate):
                 table.align_box(f'box_0_{i}', header, align='center'),
                 isalpha=True
             )
-            print(f"[DEBUG] 渲染表头 {i}: {text}")
         # 填字
         for index, func_data in enumerate(data):
             row_id = index + 1
@@ -423,9 +474,6 @@ class DefaultTemplate(PicTemplate):
                                             v_border_ignore=False   # 不忽略垂直边界
                                             )
 
-                # 打印调试信息
-                print(f"[DEBUG] 功能简述文本大小: {brief_des_text.size}, 单元格大小: ({col_width}, {row_height})")
-
                 table.img_paste(
                     brief_des_text,
                     table.align_box(f'box_{row_id}_{col_id}', brief_des_text, align='center'),
@@ -433,7 +481,8 @@ class DefaultTemplate(PicTemplate):
                 )
                 col_id += 1
 
-            print(f"[DEBUG] 渲染行 {row_id} 完成，共 {col_id} 列")
+            if trace_template.enabled:
+                trace_template.emit('plugin_menu_draw_row', row=row_id, columns=col_id)
         # 获取table尺寸
         table_size = table.img.size
 
@@ -0,0 +1,76 @@
+from itertools import count
+from typing import Dict, Iterable
+
+from nonebot import logger
+
+SUBSYSTEMS = ('handler', 'data', 'template', 'text')  # 可单独开启的调试追踪子系统
+
+
+class Tracer(object):
+    __slots__ = ('subsystem', 'enabled', 'sample_every', '_counter')
+
+    def __init__(self, subsystem: str):
+        """
+        说明:
+            子系统的调试追踪，关闭时调用处只检查 enabled，不生成任何记录字段或字符串
+            开启后每条追踪输出一条 DEBUG 级别的 nonebot 日志，字段通过 bind 写入 record["extra"]，
+            日志 sink 可按 extra["trace"]（子系统）及 extra["trace_event"]（事件名）过滤
+        用法:
+            if trace_text.enabled:
+                trace_text.emit('simple_text', text=text, size=size)
+        参数:
+            :param subsystem: 子系统名
+        """
+        self.subsystem = subsystem
+        self.enabled = False
+        self.sample_every = 1  # 每 sample_every 条追踪输出一条
+        self._counter = count()
+
+    def emit(self, event: str, **fields):
+        """
+        说明: 输出一条追踪记录，按采样间隔丢弃多余的记录
+        :param event: 事件名
+        :param fields: 记录字段
+        """
+        if self.sample_every > 1 and next(self._counter) % self.sample_every:
+            return
+        message = ' '.join(f'{key}={value!r}' for key, value in fields.items())
+        logger.opt(depth=1).bind(trace=self.subsystem, trace_event=event, **fields).debug(
+            f'[{self.subsystem}] {event} {message}')
+
+
+_tracers: Dict[str, Tracer] = {}
+_enabled = frozenset()
+_sample_every = 1
+
+
+def get_tracer(subsystem: str) -> Tracer:
+    """
+    说明: 获取子系统的追踪对象，同一子系统返回同一对象，创建时应用当前的追踪配置
+    :param subsystem: 子系统名
+    :return: Tracer对象
+    """
+    tracer = _tracers.get(subsystem)
+    if tracer is None:
+        tracer = _tracers.setdefault(subsystem, Tracer(subsystem))
+        tracer.enabled = subsystem in _enabled
+        tracer.sample_every = _sample_every
+    return tracer
+
+
+def configure_tracing(subsystems: Iterable[str], sample_every: int = 1):
+    """
+    说明: 设置开启追踪的子系统及采样间隔，对已创建及之后创建的追踪对象生效
+    :param subsystems: 子系统名，包含 all 时开启全部子系统
+    :param sample_every: 采样间隔，每 sample_every 条追踪输出一条
+    """
+    global _enabled, _sample_every
+    subsystems = {x.strip() for x in subsystems if x.strip()}
+    unknown = subsystems - set(SUBSYSTEMS) - {'all'}
+    if unknown:
+        logger.warning(f'未知的菜单调试追踪子系统: {", ".join(sorted(unknown))}，可选: {", ".join(SUBSYSTEMS)}')
+    _enabled = frozenset(SUBSYSTEMS if 'all' in subsystems else subsystems)
+    _sample_every = max(1, sample_every)
+    for subsystem, tracer in _tracers.items():
+        tracer.enabled = subsystem in _enabled
+        tracer.sample_every = _sample_every